@@ -3,16 +3,46 @@ Open WebUI AI Client
 Connects to your Open WebUI instance to get AI responses.
 Supports web search via Open WebUI's native search integration.
 """
+import asyncio
+import atexit
+import concurrent.futures
 import os
-import requests
-from openai import OpenAI
+import queue
+import re
+import threading
+import time
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
 from dotenv import load_dotenv
+from history import ConversationStore, SQLiteHistoryBackend, history_budget
+from search_cache import SearchCache
+from circuit import AdaptiveTimeout, CircuitBreaker
+import metrics
 
 load_dotenv()
 
+# Phrases in a chat answer that mean the model lacked current information
+UNCERTAINTY_PATTERN = re.compile(
+    r"\b(?:i don'?t have (?:access to )?(?:real-time|current|up-to-date|live)"
+    r"|as of my (?:last )?(?:knowledge|training|update)|knowledge cut-?off"
+    r"|i (?:can(?:no|')t|am unable to|'m unable to) (?:browse|access|search|check)"
+    r"|i'?m not (?:sure|certain)|i don'?t know"
+    r"|(?:recommend|suggest) (?:checking|visiting)|check the official)",
+    re.IGNORECASE,
+)
 
-class AIClient:
-    """Client for Open WebUI API using OpenAI-compatible interface."""
+SEARCH_SYSTEM_PROMPT = """You are a helpful assistant with web search capabilities.
+Provide accurate, up-to-date information based on web search results.
+
+FORMATTING RULES:
+- Add a SPACE or colon before inline code (e.g., "Run: `command`" not "Run`command`")
+- Put code blocks on their own line
+- Cite each source only ONCE - no duplicate links
+- Use bullet points for lists"""
+
+
+class AsyncAIClient:
+    """Asyncio client for Open WebUI API using OpenAI-compatible interface."""
     
     def __init__(self, model: str = None):
         self.api_key = os.environ.get("OPENWEBUI_API_KEY")
@@ -22,16 +52,77 @@ class AIClient:
         if not self.api_key:
             raise ValueError("OPENWEBUI_API_KEY environment variable not set")
         
+        # One pooled keep-alive HTTP client shared by chat, search and
+        # model listing. The transport retries failed connects; the OpenAI
+        # client retries 429/5xx responses with exponential backoff.
+        pool_size = int(os.environ.get("AI_POOL_SIZE", "10"))
+        self.http_client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                retries=int(os.environ.get("AI_CONNECT_RETRIES", "2")),
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        
         # Initialize OpenAI client pointing to Open WebUI
-        self.client = OpenAI(
+        self.client = AsyncOpenAI(
             base_url=self.base_url,
             api_key=self.api_key,
+            http_client=self.http_client,
+            max_retries=int(os.environ.get("AI_MAX_RETRIES", "2")),
         )
         
-        # Conversation history per room (room_id -> messages list)
-        self.conversations = {}
+        # Conversation history per room, trimmed to a per-model token
+        # budget; idle rooms are evicted. With HISTORY_DB_PATH set, history
+        # is persisted to SQLite in the background and reloaded on demand.
+        backend = None
+        db_path = os.environ.get("HISTORY_DB_PATH")
+        if db_path:
+            backend = SQLiteHistoryBackend(db_path)
+            atexit.register(backend.close)
+        self.conversations = ConversationStore(
+            capacity=int(os.environ.get("HISTORY_MAX_ROOMS", "1000")),
+            idle_ttl=float(os.environ.get("HISTORY_IDLE_TTL", "86400")),
+            budget=history_budget(self.model),
+            backend=backend,
+        )
+        
+        # Recent web-search answers (SEARCH_CACHE_SIZE=0 disables)
+        cache_size = int(os.environ.get("SEARCH_CACHE_SIZE", "500"))
+        self.search_cache = SearchCache(cache_size) if cache_size > 0 else None
+        
+        # Web search: skipped for a cool-down after repeated failures or
+        # slow answers, with a timeout that follows observed p95 latency.
+        # Failures fall back to chat, so by default they aren't retried.
+        self.search_breaker = CircuitBreaker(
+            "search",
+            failure_threshold=int(os.environ.get("SEARCH_BREAKER_FAILURES", "3")),
+            cooldown=float(os.environ.get("SEARCH_BREAKER_COOLDOWN", "60")),
+            slow_call=float(os.environ.get("SEARCH_SLOW_SECONDS", "30")),
+        )
+        self.search_timeout = AdaptiveTimeout(
+            minimum=float(os.environ.get("SEARCH_TIMEOUT_MIN", "10")),
+            maximum=float(os.environ.get("SEARCH_TIMEOUT_MAX", "60")),
+        )
+        self.search_max_retries = int(os.environ.get("SEARCH_MAX_RETRIES", "0"))
+        
+        # Model list, served from memory and refreshed in the background
+        # once older than MODELS_CACHE_TTL seconds
+        self.models_ttl = float(os.environ.get("MODELS_CACHE_TTL", "300"))
+        self._models = None
+        self._models_fetched = 0.0
+        self._models_refresh = None
+        
+        # Opt-in semantic cache for standalone chat prompts (needs NumPy)
+        self.semantic_cache = None
+        if os.environ.get("SEMANTIC_CACHE", "false").lower() in ("1", "true", "yes"):
+            from semantic_cache import SemanticCache
+            self.semantic_cache = SemanticCache(
+                capacity=int(os.environ.get("SEMANTIC_CACHE_SIZE", "1000")),
+                threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.82")),
+            )
     
-    def chat(self, message: str, room_id: str = None, system_prompt: str = None) -> str:
+    async def chat(self, message: str, room_id: str = None, system_prompt: str = None) -> str:
         """
         Send a message and get an AI response.
         
@@ -43,46 +134,125 @@ class AIClient:
         Returns:
             The AI's response text
         """
-        # Build messages list
-        messages = []
+        try:
+            assistant_message = await self._chat(message, room_id, system_prompt)
+            self._remember(room_id, message, assistant_message)
+            return assistant_message
+            
+        except Exception as e:
+            return f"Sorry, I encountered an error: {str(e)}"
+    
+    async def _chat(self, message: str, room_id: str = None, system_prompt: str = None) -> str:
+        """One chat completion (or semantic cache hit); errors propagate."""
+        messages = await self._build_messages(message, room_id, system_prompt)
         
-        # Add system prompt if provided
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+        cached = self._semantic_lookup(messages, message, system_prompt)
+        if cached is not None:
+            return cached
         
-        # Add conversation history if we're tracking a room
-        if room_id and room_id in self.conversations:
-            messages.extend(self.conversations[room_id])
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=2048,
+        )
+        assistant_message = response.choices[0].message.content
+        self._semantic_store(messages, message, assistant_message, system_prompt)
+        return assistant_message
+    
+    async def chat_stream(self, message: str, room_id: str = None, system_prompt: str = None):
+        """
+        Like chat(), but yield the response in pieces as they are generated.
         
-        # Add the new user message
-        messages.append({"role": "user", "content": message})
+        The full response is added to the room's history once the stream
+        ends. On failure the error message is yielded instead.
+        
+        Yields:
+            Chunks of the AI's response text
+        """
+        messages = await self._build_messages(message, room_id, system_prompt)
+        parts = []
+        
+        cached = self._semantic_lookup(messages, message, system_prompt)
+        if cached is not None:
+            yield cached
+            self._remember(room_id, message, cached)
+            return
         
         try:
-            response = self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=2048,
+                stream=True,
             )
-            
-            assistant_message = response.choices[0].message.content
-            
-            # Store in conversation history if tracking
-            if room_id:
-                if room_id not in self.conversations:
-                    self.conversations[room_id] = []
-                self.conversations[room_id].append({"role": "user", "content": message})
-                self.conversations[room_id].append({"role": "assistant", "content": assistant_message})
-                
-                # Keep only last 20 messages to avoid token limits
-                if len(self.conversations[room_id]) > 20:
-                    self.conversations[room_id] = self.conversations[room_id][-20:]
-            
-            return assistant_message
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                # Release the connection now, also when the caller stops
+                # reading or the generation is cancelled
+                await stream.close()
             
         except Exception as e:
-            return f"Sorry, I encountered an error: {str(e)}"
+            yield f"Sorry, I encountered an error: {str(e)}"
+            return
+        
+        self._semantic_store(messages, message, "".join(parts), system_prompt)
+        self._remember(room_id, message, "".join(parts))
     
-    def search(self, query: str, room_id: str = None) -> str:
+    def _semantic_lookup(self, messages: list, message: str, system_prompt: str = None):
+        """Cached answer for a standalone prompt that means the same, if any."""
+        if not self.semantic_cache or not self._is_standalone(messages, system_prompt):
+            return None
+        return self.semantic_cache.lookup(message, system_prompt)
+    
+    def _semantic_store(self, messages: list, message: str, answer: str, system_prompt: str = None):
+        """Cache the answer to a standalone prompt."""
+        if self.semantic_cache and answer and self._is_standalone(messages, system_prompt):
+            self.semantic_cache.add(message, answer, system_prompt)
+    
+    @staticmethod
+    def _is_standalone(messages: list, system_prompt: str = None) -> bool:
+        """Whether a request carries no room history (only system + user)."""
+        return len(messages) == (2 if system_prompt else 1)
+    
+    async def _build_messages(self, message: str, room_id: str = None, system_prompt: str = None) -> list:
+        """Build the messages list: system prompt, room history, new message."""
+        messages = []
+        
+        # Add system prompt if provided
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        # Add conversation history if we're tracking a room
+        if room_id:
+            if self.conversations.backend and room_id not in self.conversations:
+                # First use of the room since start-up or eviction: read
+                # its stored history off the loop
+                await asyncio.to_thread(self.conversations.preload, room_id)
+            messages.extend(self.conversations.messages(room_id))
+        
+        # Add the new user message
+        messages.append({"role": "user", "content": message})
+        return messages
+    
+    def _remember(self, room_id: str, user_message: str, assistant_message: str):
+        """Store an exchange in the room's conversation history."""
+        if not room_id:
+            return
+        self.conversations.extend(room_id, [("user", user_message), ("assistant", assistant_message)])
+    
+    def remember_unanswered(self, room_id: str, user_message: str):
+        """Store a user message whose answer was cancelled, so later prompts still see it."""
+        if room_id and user_message:
+            self.conversations.extend(room_id, [("user", user_message)])
+    
+    async def search(self, query: str, room_id: str = None) -> str:
         """
         Perform a web search and return AI-synthesized results.
         
@@ -96,86 +266,286 @@ class AIClient:
         Returns:
             AI-synthesized response with web search results
         """
+        # Answer repeated questions from the cache
+        cached = self.search_cache.get(self.model, query) if self.search_cache else None
+        if cached is not None:
+            self._remember(room_id, f"[Web Search] {query}", cached)
+            return cached
+        
+        # Web search is failing: go straight to chat instead of waiting
+        # for yet another failure first
+        if not self.search_breaker.allow():
+            return await self.chat(f"Please search for: {query}", room_id=room_id)
+        
         try:
-            # Build messages for the search request
-            messages = []
-            
-            # Add system prompt for search context
-            messages.append({
-                "role": "system",
-                "content": """You are a helpful assistant with web search capabilities.
-Provide accurate, up-to-date information based on web search results.
-
-FORMATTING RULES:
-- Add a SPACE or colon before inline code (e.g., "Run: `command`" not "Run`command`")
-- Put code blocks on their own line
-- Cite each source only ONCE - no duplicate links
-- Use bullet points for lists"""
-            })
-            
-            # Add the user's search query
-            messages.append({"role": "user", "content": query})
-            
-            # Make direct API call with web_search_options enabled
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 2048,
-                "features": {
-                    "web_search": True  # Open WebUI uses features.web_search
-                }
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60  # Longer timeout for web search
-            )
-            
-            if response.status_code != 200:
-                # Fallback to standard chat if web search fails
-                return self.chat(
+            try:
+                assistant_message = await self._search(query)
+            except (APIStatusError, APIConnectionError):
+                # Fallback to standard chat if web search fails or times out
+                return await self.chat(
                     f"Please search for: {query}",
                     room_id=room_id
                 )
             
-            result = response.json()
-            assistant_message = result["choices"][0]["message"]["content"]
-            
             # Store in conversation history if tracking
-            if room_id:
-                if room_id not in self.conversations:
-                    self.conversations[room_id] = []
-                self.conversations[room_id].append({"role": "user", "content": f"[Web Search] {query}"})
-                self.conversations[room_id].append({"role": "assistant", "content": assistant_message})
-                
-                # Keep only last 20 messages
-                if len(self.conversations[room_id]) > 20:
-                    self.conversations[room_id] = self.conversations[room_id][-20:]
-            
+            self._remember(room_id, f"[Web Search] {query}", assistant_message)
             return assistant_message
             
         except Exception as e:
             return f"Sorry, web search failed: {str(e)}. Try a regular chat instead."
     
+    async def _search(self, query: str) -> str:
+        """
+        One web-search completion, cached on success; errors propagate.
+        
+        Outcomes feed the circuit breaker and the adaptive timeout. A
+        trial call while the breaker is open gets the maximum timeout, so
+        a search that got slower than the learned timeout can still close
+        the breaker.
+        """
+        messages = [
+            {"role": "system", "content": SEARCH_SYSTEM_PROMPT},
+            {"role": "user", "content": query},
+        ]
+        if self.search_breaker.is_open:
+            timeout = self.search_timeout.maximum
+        else:
+            timeout = self.search_timeout.timeout()
+        metrics.set_gauge("search_timeout", round(timeout, 1))
+        
+        # Same pooled client as chat, with Open WebUI's web search enabled
+        start = time.monotonic()
+        try:
+            response = await self.client.with_options(max_retries=self.search_max_retries).chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=2048,
+                extra_body={
+                    "features": {
+                        "web_search": True  # Open WebUI uses features.web_search
+                    }
+                },
+                timeout=timeout,
+            )
+        except APITimeoutError:
+            self.search_breaker.record_failure()
+            self.search_timeout.observe_timeout(timeout)
+            raise
+        except (APIStatusError, APIConnectionError):
+            self.search_breaker.record_failure()
+            raise
+        elapsed = time.monotonic() - start
+        self.search_breaker.record_success(elapsed)
+        self.search_timeout.observe(elapsed)
+        
+        assistant_message = response.choices[0].message.content
+        if self.search_cache and assistant_message:
+            self.search_cache.put(self.model, query, assistant_message)
+        return assistant_message
+    
+    async def speculate(self, message: str, room_id: str = None, system_prompt: str = None,
+                        deadline: float = 8.0) -> tuple:
+        """
+        Run chat and web search at once and keep the first good answer.
+        
+        The chat answer wins if it arrives within `deadline` seconds and
+        doesn't sound unsure (UNCERTAINTY_PATTERN); otherwise the search
+        answer is awaited. The losing request is cancelled and only the
+        winner is added to the room's history.
+        
+        Args:
+            message: The user's message
+            room_id: Optional room ID to maintain conversation history
+            system_prompt: Optional system prompt for the chat request
+            deadline: Seconds the chat answer has to win
+            
+        Returns:
+            (response text, "chat" or "search")
+        """
+        cached = self.search_cache.get(self.model, message) if self.search_cache else None
+        if cached is not None:
+            self._remember(room_id, f"[Web Search] {message}", cached)
+            return cached, "search"
+        
+        if not self.search_breaker.allow():
+            return await self.chat(message, room_id=room_id, system_prompt=system_prompt), "chat"
+        
+        chat = asyncio.ensure_future(self._chat(message, room_id, system_prompt))
+        search = asyncio.ensure_future(self._search(message))
+        try:
+            done, _ = await asyncio.wait({chat}, timeout=deadline)
+            if chat in done and not chat.exception() and not UNCERTAINTY_PATTERN.search(chat.result() or ""):
+                return self._speculation_won(room_id, message, chat.result(), "chat")
+            
+            try:
+                return self._speculation_won(room_id, f"[Web Search] {message}", await search, "search")
+            except Exception as e:
+                # Search failed: settle for the chat answer, unsure or not
+                print(f"Speculative search failed ({e}); using chat answer")
+                try:
+                    return self._speculation_won(room_id, message, await chat, "chat")
+                except Exception as e:
+                    return f"Sorry, I encountered an error: {str(e)}", "chat"
+        finally:
+            chat.cancel()
+            search.cancel()
+    
+    def _speculation_won(self, room_id: str, user_message: str, answer: str, winner: str) -> tuple:
+        metrics.incr(f"speculative_{winner}_wins")
+        self._remember(room_id, user_message, answer)
+        return answer, winner
+    
     def clear_history(self, room_id: str):
         """Clear conversation history for a room."""
-        if room_id in self.conversations:
-            del self.conversations[room_id]
+        self.conversations.clear(room_id)
     
-    def list_models(self):
-        """List available models from Open WebUI."""
+    async def aclose(self):
+        """Close the pooled HTTP connections and flush stored history."""
+        await self.http_client.aclose()
+        self.conversations.close()
+    
+    async def list_models(self):
+        """
+        List available models from Open WebUI.
+        
+        Served from a cache (stale-while-revalidate): a cached list is
+        returned right away, and if it is older than MODELS_CACHE_TTL a
+        single background refresh is started. Only the first call waits
+        for Open WebUI, and concurrent callers share that one request.
+        """
+        if self._models is not None:
+            metrics.incr("models_cache_hits")
+            if time.monotonic() - self._models_fetched >= self.models_ttl:
+                self._refresh_models()
+            return list(self._models)
+        
         try:
-            models = self.client.models.list()
-            return [m.id for m in models.data]
+            # Shielded so one caller giving up doesn't cancel the others
+            return list(await asyncio.shield(self._refresh_models()))
         except Exception as e:
             return [f"Error listing models: {e}"]
+    
+    def _refresh_models(self) -> asyncio.Future:
+        """Start fetching the model list, unless a fetch is already running."""
+        if self._models_refresh is None:
+            self._models_refresh = asyncio.ensure_future(self._fetch_models())
+            self._models_refresh.add_done_callback(self._models_refreshed)
+        return self._models_refresh
+    
+    async def _fetch_models(self) -> list:
+        metrics.incr("models_fetches")
+        models = await self.client.models.list()
+        self._models = [m.id for m in models.data]
+        self._models_fetched = time.monotonic()
+        return self._models
+    
+    def _models_refreshed(self, task: asyncio.Future):
+        self._models_refresh = None
+        if not task.cancelled() and task.exception() and self._models is not None:
+            print(f"⚠️ Could not refresh model list ({task.exception()}); keeping cached list")
+    
+    async def validate_model(self) -> bool:
+        """
+        Check that the configured model is offered by Open WebUI.
+        
+        Also warms the model cache for /models. Prints a warning and
+        returns False if the model is missing; returns True when the
+        list can't be fetched, since that says nothing about the model.
+        """
+        try:
+            models = await self._refresh_models() if self._models is None else self._models
+        except Exception as e:
+            print(f"⚠️ Could not verify AI_MODEL '{self.model}': {e}")
+            return True
+        if self.model not in models:
+            print(f"⚠️ AI_MODEL '{self.model}' is not offered by Open WebUI. Available: {', '.join(models)}")
+            return False
+        return True
+
+
+
+class AIClient:
+    """
+    Blocking client for threaded callers.
+    
+    A thin wrapper around AsyncAIClient: every call runs as a coroutine on
+    a private event loop thread, so threads and asyncio tasks share one
+    connection pool and one set of conversation histories. The bot's own
+    coroutines can run on the same loop via run() and submit().
+    """
+    
+    def __init__(self, model: str = None):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="ai-client-loop", daemon=True)
+        self._thread.start()
+        self.aio = AsyncAIClient(model)
+    
+    @property
+    def model(self) -> str:
+        return self.aio.model
+    
+    @property
+    def conversations(self) -> ConversationStore:
+        return self.aio.conversations
+    
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the client's event loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def run(self, coro):
+        """Run a coroutine on the client's event loop and wait for its result."""
+        return self.submit(coro).result()
+    
+    def chat(self, message: str, room_id: str = None, system_prompt: str = None) -> str:
+        """Send a message and get an AI response. See AsyncAIClient.chat()."""
+        return self.run(self.aio.chat(message, room_id=room_id, system_prompt=system_prompt))
+    
+    def chat_stream(self, message: str, room_id: str = None, system_prompt: str = None):
+        """Yield the AI response in pieces. See AsyncAIClient.chat_stream()."""
+        chunks = queue.Queue()
+        
+        async def pump():
+            try:
+                async for chunk in self.aio.chat_stream(message, room_id=room_id, system_prompt=system_prompt):
+                    chunks.put(chunk)
+            finally:
+                chunks.put(None)
+        
+        future = self.submit(pump())
+        try:
+            while (chunk := chunks.get()) is not None:
+                yield chunk
+        finally:
+            # Stop generating if the caller stopped reading
+            future.cancel()
+    
+    def search(self, query: str, room_id: str = None) -> str:
+        """Perform a web search. See AsyncAIClient.search()."""
+        return self.run(self.aio.search(query, room_id=room_id))
+    
+    def speculate(self, message: str, room_id: str = None, system_prompt: str = None,
+                  deadline: float = 8.0) -> tuple:
+        """Race chat against web search. See AsyncAIClient.speculate()."""
+        return self.run(self.aio.speculate(message, room_id=room_id, system_prompt=system_prompt,
+                                           deadline=deadline))
+    
+    def clear_history(self, room_id: str):
+        """Clear conversation history for a room."""
+        self.aio.clear_history(room_id)
+    
+    def list_models(self):
+        """List available models from Open WebUI. See AsyncAIClient.list_models()."""
+        return self.run(self.aio.list_models())
+    
+    def validate_model(self) -> bool:
+        """Check the configured model. See AsyncAIClient.validate_model()."""
+        return self.run(self.aio.validate_model())
+    
+    def close(self):
+        """Close the pooled HTTP connections and stop the event loop."""
+        self.run(self.aio.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
 
 
 if __name__ == "__main__":
@@ -2,11 +2,25 @@
 Webex Bot - AI-Powered Chat Bot
 Connects to Open WebUI for AI responses with smart web search.
 """
+import asyncio
 import os
-import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from webexteamssdk import WebexTeamsAPI
+import metrics
 from ai_client import AIClient
+from coalesce import MessageCoalescer
+from commands import CommandRegistry
+from cursors import RoomCursors
+from dedup import SeenMessages, parse_created
+from dispatcher import (PRIORITY_BULK, PRIORITY_COMMAND, PRIORITY_INTERACTIVE,
+                        AsyncRoomDispatcher, RoomDispatcher)
+from routing import route_message
+from scheduler import RoomScheduler
+from webhook import create_app
 
 load_dotenv()
 
@@ -18,6 +32,62 @@ ai = AIClient()
 BOT_ID = os.environ.get("WEBEX_BOT_ID")
 bot_info = webex.people.me()
 BOT_EMAIL = bot_info.emails[0] if bot_info.emails else None
+BOT_PERSON_ID = bot_info.id
+
+# Webhook mode: set WEBHOOK_URL to the public URL Webex should POST to
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_hex(32)
+WEBHOOK_NAME = os.environ.get("WEBHOOK_NAME", "webex-bot-messages")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+
+# Messages are handled on a worker pool; each room's messages stay in order.
+# BOT_RUNTIME=asyncio runs them as tasks on one event loop instead of threads.
+BOT_RUNTIME = os.environ.get("BOT_RUNTIME", "threads").lower()
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "100" if BOT_RUNTIME == "asyncio" else "8"))
+MAX_PER_ROOM = int(os.environ.get("MAX_PER_ROOM", "1"))
+# When workers are busy: commands first, then DMs and @mentions, then
+# group traffic. Each level is worth PRIORITY_AGING seconds of waiting.
+PRIORITY_AGING = float(os.environ.get("PRIORITY_AGING", "10"))
+
+# Messages already handled (bounded; see dedup.py)
+seen_messages = SeenMessages(capacity=int(os.environ.get("DEDUP_CAPACITY", "10000")))
+
+# Newest message seen per room; polling pages back until it reaches it
+room_cursors = RoomCursors()
+POLL_PAGE_SIZE = int(os.environ.get("POLL_PAGE_SIZE", "5"))
+MAX_BACKFILL = int(os.environ.get("MAX_BACKFILL", "100"))
+
+# Streaming: post a placeholder and edit it as the AI response arrives
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_MAX_EDITS = int(os.environ.get("STREAM_MAX_EDITS", "10"))
+STREAM_PLACEHOLDER = "…"
+
+# Borderline messages: race chat against web search and keep the chat
+# answer if it comes back within the deadline without sounding unsure
+SPECULATIVE_SEARCH = os.environ.get("SPECULATIVE_SEARCH", "false").lower() in ("1", "true", "yes")
+SPECULATIVE_DEADLINE = float(os.environ.get("SPECULATIVE_DEADLINE", "8"))
+
+# A newer message cancels the answer still being generated for the same
+# person ("person"), for anyone in the room ("room"), or never ("off")
+CANCEL_SUPERSEDED = os.environ.get("CANCEL_SUPERSEDED", "person").lower()
+
+# Answers being generated: room_id -> (personEmail, asyncio task)
+generations = {}
+generations_lock = threading.Lock()
+
+# Rooms are polled based on their lastActivity (see scheduler.py)
+POLL_TICK = float(os.environ.get("POLL_TICK", "2"))
+room_scheduler = RoomScheduler(
+    min_interval=POLL_TICK,
+    max_interval=float(os.environ.get("POLL_MAX_INTERVAL", "300")),
+    start_time=room_cursors.start_time,
+)
+ROOM_PAGE_SIZE = int(os.environ.get("ROOM_PAGE_SIZE", "100"))
+ROOM_FULL_SCAN_INTERVAL = float(os.environ.get("ROOM_FULL_SCAN_INTERVAL", "300"))
+
+# How often the poll loop prints a metrics summary (0 disables)
+METRICS_LOG_INTERVAL = int(os.environ.get("METRICS_LOG_INTERVAL", "300"))
 
 # System prompt for the AI with formatting guidelines for Webex
 SYSTEM_PROMPT = """You are a helpful AI assistant in a Webex chat with web search capabilities.
@@ -31,193 +101,527 @@ FORMATTING RULES (important for Webex rendering):
 
 Be concise but friendly. If you don't know something, say so honestly."""
 
-# Keywords that suggest needing real-time/current information
-SEARCH_KEYWORDS = [
-    # Time-sensitive
-    'latest', 'current', 'today', 'now', 'recent', 'new', 'update',
-    'this week', 'this month', 'this year', '2024', '2025', '2026',
-    # News & events  
-    'news', 'headline', 'breaking', 'announced', 'release', 'launched',
-    # Real-time data
-    'weather', 'forecast', 'temperature', 'stock', 'price', 'score',
-    'status', 'outage', 'down', 'working',
-    # Research/lookup
-    'how to', 'what is', 'who is', 'when did', 'where is',
-    'documentation', 'docs', 'guide', 'tutorial', 'article',
-    # Tech support specific
-    'error', 'fix', 'solve', 'troubleshoot', 'issue', 'problem',
-    'not working', 'broken', 'failed', 'help me',
-]
-
-# Patterns suggesting user is struggling/confused
-STRUGGLE_PATTERNS = [
-    r'\?\s*\?+',              # Multiple question marks
-    r'still (not|doesn\'t|won\'t|can\'t)',  # Still having issues
-    r'tried (everything|that|already)',      # Tried things
-    r'nothing (works|worked)',               # Nothing works
-    r'i (don\'t|cant|cannot) (understand|figure|get)',  # Confusion
-    r'(please|plz) help',                    # Asking for help
-    r'what (else|now)',                      # What else to try
-    r'any (other|idea|suggestion)',          # Looking for alternatives
-]
-
-
-def should_use_web_search(text: str, room_id: str = None) -> bool:
+def fetch_new_messages(room_id: str) -> list:
+    """
+    List a room's messages newer than its cursor, oldest first.
+    
+    Pages back through the room (POLL_PAGE_SIZE messages per request)
+    until the cursor is reached, so a burst bigger than one page is
+    never dropped. At most MAX_BACKFILL messages are returned.
+    """
+    new_messages = []
+    pulled = 0
+    for msg in webex.messages.list(roomId=room_id, max=POLL_PAGE_SIZE):
+        pulled += 1
+        if room_cursors.reached(room_id, msg.id, msg.created) or len(new_messages) >= MAX_BACKFILL:
+            break
+        new_messages.append(msg)
+    metrics.incr("webex_api_calls", max(1, -(-pulled // POLL_PAGE_SIZE)))
+    
+    new_messages.reverse()
+    if new_messages:
+        room_cursors.advance(room_id, new_messages[-1].id, new_messages[-1].created)
+    return new_messages
+
+
+def refresh_rooms(full: bool = False):
     """
-    Determine if the message should trigger automatic web search.
+    Feed every room's lastActivity to the room scheduler.
     
-    Checks for:
-    1. Keywords suggesting need for current/real-time info
-    2. Patterns suggesting user is struggling
-    3. Questions that likely need external lookup
+    Rooms are listed most recently active first. Unless `full` is set,
+    paging stops at the first room with no activity since the previous
+    listing, so a quiet deployment costs one rooms.list page per tick.
+    A full listing also forgets rooms the bot is no longer in.
     """
-    text_lower = text.lower()
+    mark = room_scheduler.activity_mark
+    listed = []
+    pulled = 0
+    for room in webex.rooms.list(sortBy="lastactivity", max=ROOM_PAGE_SIZE):
+        pulled += 1
+        last_activity = parse_created(room.lastActivity)
+        if not full and mark and last_activity and last_activity <= mark:
+            break
+        room_scheduler.observe(room.id, last_activity)
+        listed.append(room.id)
+    metrics.incr("webex_api_calls", max(1, -(-pulled // ROOM_PAGE_SIZE)))
     
-    # Check for search keywords
-    for keyword in SEARCH_KEYWORDS:
-        if keyword in text_lower:
-            print(f"  🔍 Auto-search triggered by keyword: '{keyword}'")
-            return True
+    if full:
+        room_scheduler.retain(listed)
+    metrics.set_gauge("rooms_tracked", len(room_scheduler))
+
+
+def get_message(message_id: str):
+    """Fetch a message by id (webhook events only carry the id)."""
+    metrics.incr("webex_api_calls")
+    return webex.messages.get(message_id)
+
+
+async def stream_reply(room_id: str, chunks, on_complete=None) -> str:
+    """
+    Post a placeholder message and edit it as response chunks arrive.
     
-    # Check for struggle patterns
-    for pattern in STRUGGLE_PATTERNS:
-        if re.search(pattern, text_lower):
-            print(f"  🔍 Auto-search triggered by struggle pattern")
-            return True
+    The first text shows up as soon as it is generated; after that edits
+    are sent at most every STREAM_EDIT_INTERVAL seconds, and never more
+    than STREAM_MAX_EDITS times (Webex limits edits per message).
+    `on_complete` is called once the last chunk has arrived, before the
+    final edit.
     
-    # Check if it's a question about something specific
-    if '?' in text and len(text) > 20:
-        # Questions with specific proper nouns or tech terms
-        if re.search(r'(how|what|why|when|where|can|does|is|are)\s+(the|a|my|this|it)', text_lower):
-            print(f"  🔍 Auto-search triggered by detailed question")
-            return True
+    Returns:
+        The full response text
+    """
+    metrics.incr("webex_api_calls")
+    placeholder = await asyncio.to_thread(webex.messages.create, roomId=room_id, markdown=STREAM_PLACEHOLDER)
+    
+    text = ""
+    edits = 0
+    last_edit = 0.0
+    try:
+        async for chunk in chunks:
+            text += chunk
+            # Keep one edit in reserve for the final text
+            if edits < STREAM_MAX_EDITS - 1 and time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                metrics.incr("webex_api_calls")
+                await asyncio.to_thread(webex.messages.edit, messageId=placeholder.id, roomId=room_id,
+                                        markdown=text + " " + STREAM_PLACEHOLDER)
+                edits += 1
+                last_edit = time.monotonic()
+    except asyncio.CancelledError:
+        # Don't leave a placeholder that looks like it is still typing
+        metrics.incr("webex_api_calls")
+        await asyncio.to_thread(webex.messages.edit, messageId=placeholder.id, roomId=room_id,
+                                markdown=(text + " " if text else "") + "*(stopped)*")
+        raise
     
-    return False
+    if on_complete:
+        on_complete()
+    metrics.incr("webex_api_calls")
+    await asyncio.to_thread(webex.messages.edit, messageId=placeholder.id, roomId=room_id,
+                            markdown=text or "(no response)")
+    return text
 
 
-def process_message(message_id: str):
-    """Process an incoming message and generate AI response."""
+def split_burst(burst: list) -> list:
+    """
+    Split a burst of messages into the parts answered one after another.
+    
+    Each command gets a part of its own, so it still runs (and isn't sent
+    to the AI as text); the chat messages between commands are joined
+    into one prompt.
+    """
+    parts, chat = [], []
+    for message in burst:
+        if commands.parse(message.text):
+            if chat:
+                parts.append(chat)
+                chat = []
+            parts.append([message])
+        else:
+            chat.append(message)
+    if chat:
+        parts.append(chat)
+    return parts
+
+
+def burst_text(burst: list) -> str:
+    """The prompt for a burst: its messages' text, one per line."""
+    return "\n".join(m.text.strip() for m in burst if m.text)
+
+
+async def process_message_async(message):
+    """
+    Process an incoming message and generate AI response.
+    
+    Runs on the AI client's event loop; blocking Webex SDK calls are
+    moved to threads so many messages can be in flight at once.
+    
+    Args:
+        message: The message object, or just its id (fetched if needed),
+            or a list of them from one person, answered as one prompt
+            (commands among them are answered on their own)
+    """
+    parts = []
     try:
-        # Get the message details
-        message = webex.messages.get(message_id)
+        burst = message if isinstance(message, list) else [message]
+        burst = [await asyncio.to_thread(get_message, m) if isinstance(m, str) else m for m in burst]
+        message = burst[-1]
         
         # Don't respond to our own messages
         if message.personEmail == BOT_EMAIL:
             return
         
-        # Handle special commands first
-        text = message.text.strip()
-        text_lower = text.lower()
+        # answer_async() takes each part off the list as it answers it
+        parts = split_burst(burst)
+        while parts:
+            await answer_async(parts)
         
-        if text_lower == "/clear":
-            ai.clear_history(message.roomId)
-            response = "✓ Conversation history cleared!"
-        elif text_lower == "/help":
-            response = """**Available Commands:**
-• Just type your message - AI auto-searches when needed 🔍
-• `/search <query>` - Force a web search
-• `/clear` - Clear conversation history
-• `/help` - Show this help message
-• `/models` - List available AI models
-
-💡 *Web search activates automatically for current events, troubleshooting, and when you need real-time info!*"""
-        elif text_lower.startswith("/search"):
-            # Explicit search command
-            query = text[7:].strip()
-            if not query:
-                response = "❌ Please provide a search query. Example: `/search latest AI news`"
-            else:
-                response = "🔍 Searching the web...\n\n"
-                search_result = ai.search(query, room_id=message.roomId)
-                response += search_result
-        elif text_lower == "/models":
-            models = ai.list_models()
-            response = f"**Available Models:**\n" + "\n".join(f"• {m}" for m in models)
+    except asyncio.CancelledError:
+        # Superseded by a newer message or /stop: post nothing, but keep
+        # the unanswered chat text in the history so the next prompt
+        # (often the rest of the question) still has it
+        print(f"⏹️ Cancelled answer in room {getattr(message, 'roomId', None)}")
+        for part in parts:
+            text = burst_text(part)
+            if not commands.parse(text):
+                ai.aio.remember_unanswered(message.roomId, text)
+    except Exception as e:
+        print(f"Error processing message: {e}")
+    finally:
+        with generations_lock:
+            entry = generations.get(getattr(message, "roomId", None))
+            if entry and entry[1] is asyncio.current_task():
+                del generations[message.roomId]
+
+
+async def answer_async(parts: list):
+    """
+    Answer the first of a burst's parts and take it off `parts`.
+    
+    A part is one command, or one or more chat messages answered as a
+    single prompt. If this is cancelled before the answer is complete,
+    the part is put back, so process_message_async() keeps its text in
+    the history. Once complete, the answer is already in the history and
+    its post can no longer be stopped, so it is not put back.
+    """
+    burst = parts.pop(0)
+    message = burst[-1]
+    answered = False
+    
+    def complete():
+        nonlocal answered
+        answered = True
+    
+    try:
+        text = burst_text(burst)
+        if not text:
+            # Attachments only: nothing to answer
+            return
+        metrics.incr("messages_handled")
+        command = commands.parse(text)
+        
+        # Let a newer message (or /stop) cancel this one
+        if not (command and command[0].fast):
+            with generations_lock:
+                generations[message.roomId] = (message.personEmail, asyncio.current_task())
+        
+        if command:
+            handler, args = command[0].handler, command[1]
+            response = handler(message, args) if command[0].fast else await handler(message, args)
         else:
             # Regular message - check if we should auto-search
-            if should_use_web_search(text, message.roomId):
+            route = route_message(text, message.roomId, borderline=SPECULATIVE_SEARCH)
+            if SPECULATIVE_SEARCH and route.borderline:
+                response, winner = await ai.aio.speculate(
+                    text,
+                    room_id=message.roomId,
+                    system_prompt=SYSTEM_PROMPT,
+                    deadline=SPECULATIVE_DEADLINE
+                )
+                print(f"  🏁 Speculative {winner} answer won")
+                if winner == "search":
+                    response = "🔍 *Searching for current info...*\n\n" + response
+            elif route.search:
                 response = "🔍 *Searching for current info...*\n\n"
-                search_result = ai.search(text, room_id=message.roomId)
+                search_result = await ai.aio.search(text, room_id=message.roomId)
                 response += search_result
+            elif STREAM_RESPONSES:
+                # Streamed AI response, posted as it is generated
+                response = await stream_reply(message.roomId, ai.aio.chat_stream(
+                    message=text,
+                    room_id=message.roomId,
+                    system_prompt=SYSTEM_PROMPT
+                ), on_complete=complete)
+                print(f"Responded to {message.personEmail}: {response[:100]}...")
+                return
             else:
                 # Standard AI response
-                response = ai.chat(
+                response = await ai.aio.chat(
                     message=text,
                     room_id=message.roomId,
                     system_prompt=SYSTEM_PROMPT
                 )
         
         # Send the response with markdown formatting
-        webex.messages.create(
+        complete()
+        metrics.incr("webex_api_calls")
+        await asyncio.to_thread(
+            webex.messages.create,
             roomId=message.roomId,
             markdown=response
         )
         
         print(f"Responded to {message.personEmail}: {response[:100]}...")
         
+    except asyncio.CancelledError:
+        if not answered:
+            parts.insert(0, burst)
+        raise
     except Exception as e:
+        # Cancellation is not an Exception: it ends the whole burst
         print(f"Error processing message: {e}")
 
 
-def poll_messages():
-    """Poll for new messages (simple approach without webhooks)."""
-    import time
+def cancel_generation(room_id: str, person: str = None) -> bool:
+    """
+    Cancel the answer being generated in a room, if any.
     
+    With `person`, only an answer to that person's message is cancelled.
+    The AI request is aborted (closing its HTTP stream) and nothing is
+    posted for it.
+    
+    Returns:
+        Whether an answer was cancelled
+    """
+    with generations_lock:
+        entry = generations.get(room_id)
+    if entry is None or (person and entry[0] != person):
+        return False
+    ai.loop.call_soon_threadsafe(entry[1].cancel)
+    metrics.incr("generations_cancelled")
+    return True
+
+
+def supersede(room_id: str, person: str):
+    """Cancel in-flight work made stale by a new message."""
+    if CANCEL_SUPERSEDED == "room":
+        cancel_generation(room_id)
+    elif CANCEL_SUPERSEDED == "person":
+        cancel_generation(room_id, person)
+
+
+# Slash commands. Fast ones only touch local state, don't depend on the
+# room's message order, and are answered on their own lane, ahead of
+# queued chat. Register more with @commands.command(...) without
+# touching process_message_async().
+commands = CommandRegistry()
+command_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix="commands")
+
+
+@commands.command("/search", help="Force a web search", usage="/search <query>")
+async def search_command(message, query: str) -> str:
+    if not query:
+        return "❌ Please provide a search query. Example: `/search latest AI news`"
+    return "🔍 Searching the web...\n\n" + await ai.aio.search(query, room_id=message.roomId)
+
+
+@commands.command("/stop", help="Stop the answer being generated", fast=True)
+def stop_command(message, args: str) -> str:
+    # Also drop the messages still waiting to be coalesced, keeping
+    # their text in the history like a cancelled answer's
+    pending = coalescer.discard(message.roomId, message.personEmail)
+    ai.aio.remember_unanswered(message.roomId, burst_text(pending))
+    cancel_generation(message.roomId)
+    return "⏹️ Stopped."
+
+
+# Not fast: it runs in the room's order, after any answer still being
+# generated (which would otherwise re-add its exchange to the history)
+@commands.command("/clear", help="Clear conversation history")
+async def clear_command(message, args: str) -> str:
+    ai.clear_history(message.roomId)
+    return "✓ Conversation history cleared!"
+
+
+@commands.command("/help", help="Show this help message", fast=True)
+def help_command(message, args: str) -> str:
+    return "\n".join([
+        "**Available Commands:**",
+        "• Just type your message - AI auto-searches when needed 🔍",
+        *commands.help_lines(),
+        "",
+        "💡 *Web search activates automatically for current events, troubleshooting, "
+        "and when you need real-time info!*",
+    ])
+
+
+@commands.command("/models", help="List available AI models")
+async def models_command(message, args: str) -> str:
+    models = await ai.aio.list_models()
+    return f"**Available Models:**\n" + "\n".join(f"• {m}" for m in models)
+
+
+def answer_fast_command(message, command, args: str):
+    """Answer a fast command on the command lane, bypassing the message queue."""
+    try:
+        metrics.incr("messages_handled")
+        metrics.incr("fast_commands")
+        response = command.handler(message, args)
+        metrics.incr("webex_api_calls")
+        webex.messages.create(roomId=message.roomId, markdown=response)
+        print(f"Responded to {message.personEmail}: {response[:100]}...")
+    except Exception as e:
+        print(f"Error answering {command.name}: {e}")
+
+
+def process_message(message):
+    """Blocking version of process_message_async(), for worker threads."""
+    ai.run(process_message_async(message))
+
+
+if BOT_RUNTIME == "asyncio":
+    dispatcher = AsyncRoomDispatcher(ai.loop, max_workers=MAX_WORKERS, max_per_room=MAX_PER_ROOM,
+                                     aging=PRIORITY_AGING)
+    handle_message = process_message_async
+else:
+    dispatcher = RoomDispatcher(max_workers=MAX_WORKERS, max_per_room=MAX_PER_ROOM, aging=PRIORITY_AGING)
+    handle_message = process_message
+
+
+def message_priority(room_type: str, mentioned_people=None, text: str = None) -> int:
+    """Dispatch priority of a message: commands, then DMs and @mentions, then the rest."""
+    if commands.parse(text):
+        return PRIORITY_COMMAND
+    if room_type == "direct" or (BOT_PERSON_ID and BOT_PERSON_ID in (mentioned_people or [])):
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_BULK
+
+
+def accept_message(msg):
+    """Answer a fast command right away, or queue the message for its room."""
+    print(f"\n📩 New message from {msg.personEmail}")
+    command = commands.parse(msg.text)
+    if command and command[0].fast:
+        command_lane.submit(answer_fast_command, msg, *command)
+        return
+    
+    priority = message_priority(msg.roomType, msg.mentionedPeople, msg.text)
+    supersede(msg.roomId, msg.personEmail)
+    coalescer.add(msg.roomId, msg.personEmail, msg,
+                  immediate=priority == PRIORITY_COMMAND, priority=priority)
+
+
+def dispatch_burst(room_id: str, burst: list, priority: int = PRIORITY_BULK):
+    """Queue a burst of messages from one person as a single task."""
+    dispatcher.submit(room_id, handle_message, burst, priority=priority)
+
+
+# Messages one person sends within COALESCE_WINDOW seconds of each other
+# are answered together (COALESCE_WINDOW=0 answers each one separately)
+coalescer = MessageCoalescer(
+    dispatch_burst,
+    window=float(os.environ.get("COALESCE_WINDOW", "1.0")),
+    max_wait=float(os.environ.get("COALESCE_MAX_WAIT", "5")),
+)
+
+
+def print_banner(mode: str):
+    """Print the startup banner."""
     print("=" * 50)
     print("🤖 Webex Bot Started!")
     print(f"   Bot Email: {BOT_EMAIL}")
     print(f"   AI Model: {ai.model}")
+    print(f"   Mode: {mode}, {BOT_RUNTIME}")
     print("=" * 50)
+    # Also fills the model cache, so the first /models answers instantly
+    ai.validate_model()
     print("\nListening for messages... (Ctrl+C to stop)\n")
-    
-    # Track processed messages
-    processed = set()
-    
-    # Get initial messages to avoid processing old ones
-    try:
-        rooms = webex.rooms.list(max=10)
-        for room in rooms:
-            messages = webex.messages.list(roomId=room.id, max=5)
-            for msg in messages:
-                processed.add(msg.id)
-    except Exception as e:
-        print(f"Warning: Could not fetch initial messages: {e}")
+
+
+def poll_messages():
+    """Poll for new messages (simple approach without webhooks)."""
+    print_banner("polling")
     
     # Poll loop
+    last_metrics_log = time.monotonic()
+    last_full_scan = None
     while True:
         try:
-            # Check all rooms the bot is in
-            rooms = list(webex.rooms.list(max=50))
+            # Find rooms with new activity (all rooms on a full scan)
+            full = last_full_scan is None or time.monotonic() - last_full_scan >= ROOM_FULL_SCAN_INTERVAL
+            refresh_rooms(full=full)
+            if full:
+                last_full_scan = time.monotonic()
             
-            for room in rooms:
-                # Get recent messages
-                messages = list(webex.messages.list(roomId=room.id, max=5))
+            for room_id in room_scheduler.due_rooms():
+                # Get messages since the room's cursor, oldest first
+                messages = fetch_new_messages(room_id)
+                room_scheduler.record_poll(room_id, found_messages=bool(messages))
                 
                 for msg in messages:
                     # Skip already processed
-                    if msg.id in processed:
+                    if not seen_messages.add(msg.id, msg.roomId, msg.created):
                         continue
                     
                     # Skip bot's own messages
                     if msg.personEmail == BOT_EMAIL:
-                        processed.add(msg.id)
                         continue
                     
-                    # Process the message
-                    print(f"\n📩 New message from {msg.personEmail}")
-                    processed.add(msg.id)
-                    process_message(msg.id)
+                    # Process the message (commands right away)
+                    accept_message(msg)
+            
+            metrics.set_gauge("dedup_size", len(seen_messages))
+            metrics.set_gauge("dispatch_pending", dispatcher.pending())
+            if METRICS_LOG_INTERVAL and time.monotonic() - last_metrics_log >= METRICS_LOG_INTERVAL:
+                metrics.log_summary()
+                last_metrics_log = time.monotonic()
             
             # Wait before next poll
-            time.sleep(2)
+            time.sleep(POLL_TICK)
             
         except KeyboardInterrupt:
-            print("\n\n👋 Bot stopped.")
+            # Answer what was already received; a second Ctrl+C drops it
+            coalescer.flush_all()
+            print(f"\n\n👋 Stopping: finishing {dispatcher.pending()} queued message(s)... (Ctrl+C to skip)")
+            try:
+                dispatcher.shutdown(wait=True)
+            except KeyboardInterrupt:
+                dispatcher.shutdown(wait=False)
+            print("👋 Bot stopped.")
             break
         except Exception as e:
             print(f"Error in poll loop: {e}")
             time.sleep(5)
 
 
+def handle_webhook_message(data: dict):
+    """Handle the data of a messages/created webhook."""
+    if not data.get("id"):
+        return
+    
+    # Skip redeliveries and bot's own messages without fetching them
+    if not seen_messages.add(data["id"], data.get("roomId"), data.get("created")):
+        return
+    metrics.set_gauge("dedup_size", len(seen_messages))
+    metrics.set_gauge("dispatch_pending", dispatcher.pending())
+    if data.get("personEmail") == BOT_EMAIL:
+        return
+    
+    # The event carries no text: fetch the message here so commands are
+    # recognized (fast ones like /stop mustn't queue behind the answer
+    # they stop). Answering still happens off the request thread.
+    try:
+        msg = get_message(data["id"])
+    except Exception as e:
+        print(f"Error fetching message {data['id']}: {e}")
+        return
+    accept_message(msg)
+
+
+def register_webhook():
+    """Create (or replace) the bot's messages/created webhook."""
+    for hook in webex.webhooks.list():
+        if hook.name == WEBHOOK_NAME:
+            webex.webhooks.delete(hook.id)
+    
+    webex.webhooks.create(
+        name=WEBHOOK_NAME,
+        targetUrl=WEBHOOK_URL,
+        resource="messages",
+        event="created",
+        secret=WEBHOOK_SECRET,
+    )
+
+
+def run_webhook():
+    """Receive messages via Webex webhooks instead of polling."""
+    print_banner(f"webhook ({WEBHOOK_URL})")
+    
+    register_webhook()
+    app = create_app(handle_webhook_message, WEBHOOK_SECRET)
+    app.run(host="0.0.0.0", port=WEBHOOK_PORT, threaded=True)
+
+
 if __name__ == "__main__":
-    poll_messages()
+    if WEBHOOK_URL:
+        run_webhook()
+    else:
+        poll_messages()
@@ -0,0 +1,47 @@
+"""
+Bounded Caches
+Small thread-safe caches used to keep memory flat in a long-running bot.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Fixed-capacity mapping that evicts the least recently used entry.
+
+    Entries can also be given a time-to-live; expired entries behave as
+    if they were never cached.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        # key -> (value, expiry time or None)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value (marking it recently used) or `default`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, ttl: float = None):
+        """Insert or refresh an entry, evicting the oldest when full."""
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,117 @@
+"""
+Circuit Breaker
+Stops calling a failing dependency for a while, and derives its request
+timeout from recently observed latency instead of a fixed worst case.
+"""
+import threading
+import time
+from collections import deque
+
+import metrics
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures or slow calls.
+
+    While open, allow() returns False, so callers skip the dependency.
+    Every `cooldown` seconds one trial call is let through; its success
+    closes the breaker again, its failure keeps it open for another
+    cooldown. A call slower than `slow_call` seconds counts as a failure
+    even though it returned an answer.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 60, slow_call: float = None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.slow_call = slow_call
+        self.failures = 0
+        self._retry_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._retry_at is not None
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now."""
+        with self._lock:
+            if self._retry_at is None:
+                return True
+            now = time.monotonic()
+            if now < self._retry_at:
+                metrics.incr(f"{self.name}_short_circuited")
+                return False
+            # Let one trial through; the next waits another cooldown
+            self._retry_at = now + self.cooldown
+            return True
+
+    def record_success(self, elapsed: float):
+        """Report a call that returned after `elapsed` seconds."""
+        if self.slow_call is not None and elapsed > self.slow_call:
+            self.record_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            if self._retry_at is not None:
+                self._retry_at = None
+                print(f"✅ {self.name} circuit closed")
+                metrics.set_gauge(f"{self.name}_breaker_open", 0)
+
+    def record_failure(self):
+        """Report a failed (or too slow) call."""
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                return
+            if self._retry_at is None:
+                print(f"⚡ {self.name} circuit opened after {self.failures} failures; "
+                      f"skipping it for {self.cooldown:g}s")
+                metrics.incr(f"{self.name}_breaker_trips")
+                metrics.set_gauge(f"{self.name}_breaker_open", 1)
+            self._retry_at = time.monotonic() + self.cooldown
+
+
+class AdaptiveTimeout:
+    """
+    A timeout that follows the p95 of recent call latencies.
+
+    The timeout is `multiplier` x the 95th percentile of the last
+    `window` calls, kept between `minimum` and `maximum`. A call that
+    timed out counts as taking the whole timeout, so when the dependency
+    slows down the timeout grows with it instead of cutting every call
+    short. Until `min_samples` calls have been seen it is `maximum`.
+    """
+
+    def __init__(self, minimum: float = 10, maximum: float = 60, multiplier: float = 1.5,
+                 window: int = 200, min_samples: int = 20):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed: float):
+        """Record the latency of a successful call."""
+        with self._lock:
+            self._latencies.append(elapsed)
+
+    def observe_timeout(self, timeout: float):
+        """Record a call cut off after `timeout` seconds (it took at least that long)."""
+        with self._lock:
+            self._latencies.append(timeout)
+
+    def p95(self):
+        with self._lock:
+            if not self._latencies:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def timeout(self) -> float:
+        """Current timeout in seconds."""
+        if len(self._latencies) < self.min_samples:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, self.p95() * self.multiplier))
@@ -0,0 +1,106 @@
+"""
+Message Coalescing
+Merges a burst of messages one person sends to a room in quick
+succession, so a question split across several messages gets one
+prompt and one answer.
+"""
+import threading
+import time
+
+import metrics
+
+
+class MessageCoalescer:
+    """
+    Per-room debounce of consecutive messages from the same person.
+
+    A room's burst is handed to `on_flush(room_id, items, priority)`,
+    with the best (lowest) priority of its messages, once no new
+    message has arrived for `window` seconds, or `max_wait` seconds after
+    its first message at the latest. A message from someone else, or an
+    `immediate` one (e.g. a command), flushes the pending burst first;
+    immediate messages are then passed on alone without waiting.
+    """
+
+    def __init__(self, on_flush, window: float = 1.0, max_wait: float = 5.0):
+        self.on_flush = on_flush
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        # room_id -> {"person", "items", "priority", "first", "deadline"}
+        self._bursts = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._flush_loop, name="coalescer", daemon=True)
+        self._thread.start()
+
+    def add(self, room_id: str, person: str, item, immediate: bool = False, priority: int = 0):
+        """Add a message (or message id) to its room's burst."""
+        if self.window <= 0:
+            self.on_flush(room_id, [item], priority)
+            return
+
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            burst = self._bursts.get(room_id)
+            if burst and (immediate or burst["person"] != person):
+                burst = self._bursts.pop(room_id)
+                ready.append((burst["items"], burst["priority"]))
+                burst = None
+
+            if immediate:
+                ready.append(([item], priority))
+            elif burst:
+                burst["items"].append(item)
+                burst["priority"] = min(burst["priority"], priority)
+                burst["deadline"] = min(now + self.window, burst["first"] + self.max_wait)
+                metrics.incr("messages_coalesced")
+            else:
+                self._bursts[room_id] = {
+                    "person": person,
+                    "items": [item],
+                    "priority": priority,
+                    "first": now,
+                    "deadline": now + self.window,
+                }
+                self._wake.notify()
+
+        for items, burst_priority in ready:
+            self.on_flush(room_id, items, burst_priority)
+
+    def discard(self, room_id: str, person: str) -> list:
+        """Drop a room's pending burst if it is `person`'s; returns its items."""
+        with self._lock:
+            burst = self._bursts.get(room_id)
+            if not burst or burst["person"] != person:
+                return []
+            del self._bursts[room_id]
+        return burst["items"]
+
+    def flush_all(self):
+        """Hand over every pending burst now."""
+        with self._lock:
+            bursts, self._bursts = self._bursts, {}
+        for room_id, burst in bursts.items():
+            self.on_flush(room_id, burst["items"], burst["priority"])
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = [room_id for room_id, burst in self._bursts.items() if burst["deadline"] <= now]
+                ready = [(room_id, self._bursts.pop(room_id)) for room_id in due]
+                if not ready:
+                    next_deadline = min((b["deadline"] for b in self._bursts.values()), default=None)
+                    self._wake.wait(None if next_deadline is None else next_deadline - now)
+                    continue
+
+            for room_id, burst in ready:
+                try:
+                    self.on_flush(room_id, burst["items"], burst["priority"])
+                except Exception as e:
+                    print(f"Error flushing messages for room {room_id}: {e}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._bursts)
@@ -0,0 +1,70 @@
+"""
+Bot Commands
+Registry of slash commands. Commands marked `fast` are answered from
+local state only (no AI backend, no Webex lookups) and regardless of
+the room's message order, so the bot can answer them on a dedicated
+lane instead of queueing them with chat.
+"""
+import threading
+from typing import Callable, NamedTuple
+
+
+class Command(NamedTuple):
+    """A registered slash command."""
+    name: str
+    handler: Callable
+    help: str
+    usage: str
+    fast: bool
+
+
+class CommandRegistry:
+    """
+    Slash commands by name.
+
+    A handler is called as `handler(message, args)`, where `args` is the
+    text after the command name, and returns the reply. Fast handlers
+    are plain functions that must not do I/O; the others are coroutines.
+    """
+
+    def __init__(self):
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, handler: Callable, help: str = "", usage: str = None, fast: bool = False):
+        """Add (or replace) a command; `name` includes the leading '/'."""
+        with self._lock:
+            self._commands[name.lower()] = Command(name.lower(), handler, help, usage or name, fast)
+
+    def command(self, name: str, help: str = "", usage: str = None, fast: bool = False):
+        """Decorator form of register()."""
+        def decorator(handler):
+            self.register(name, handler, help=help, usage=usage, fast=fast)
+            return handler
+        return decorator
+
+    def parse(self, text: str):
+        """
+        Split a message into a registered command and its arguments.
+
+        Returns:
+            (Command, args), or None if the message isn't a known command
+        """
+        text = (text or "").strip()
+        if not text.startswith("/"):
+            return None
+        name, _, args = text.partition(" ")
+        command = self._commands.get(name.lower())
+        return (command, args.strip()) if command else None
+
+    def help_lines(self) -> list:
+        """One "• `usage` - help" line per command, in registration order."""
+        with self._lock:
+            commands = list(self._commands.values())
+        return [f"• `{c.usage}` - {c.help}" for c in commands if c.help]
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._commands
+
+    def __len__(self) -> int:
+        return len(self._commands)
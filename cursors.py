@@ -0,0 +1,46 @@
+"""
+Room Cursors
+Tracks the newest message handled in each room so polling only has to
+read messages newer than that.
+"""
+import threading
+from datetime import datetime, timezone
+
+from dedup import parse_created
+
+
+class RoomCursors:
+    """
+    Per-room cursor: the id and `created` time of the newest message seen.
+
+    Rooms without a cursor start at `start_time` (default: now), so
+    messages sent before the bot started are never treated as new.
+    """
+
+    def __init__(self, start_time: datetime = None):
+        self.start_time = start_time or datetime.now(timezone.utc)
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def reached(self, room_id: str, message_id: str, created) -> bool:
+        """Whether a message is at or behind the room's cursor."""
+        created = parse_created(created)
+        with self._lock:
+            cursor_id, cursor_created = self._cursors.get(room_id, (None, self.start_time))
+        if message_id == cursor_id:
+            return True
+        return bool(created and created < cursor_created)
+
+    def advance(self, room_id: str, message_id: str, created):
+        """Move the room's cursor forward to a newer message."""
+        created = parse_created(created)
+        if created is None:
+            return
+        with self._lock:
+            current = self._cursors.get(room_id)
+            if current is None or created >= current[1]:
+                self._cursors[room_id] = (message_id, created)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cursors)
@@ -0,0 +1,68 @@
+"""
+Message De-duplication
+Remembers which messages the bot has already seen using a fixed amount
+of memory, no matter how long the bot runs.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+def parse_created(created):
+    """Return a message's `created` value as a datetime (None if unknown)."""
+    if created is None or isinstance(created, datetime):
+        return created
+    try:
+        return datetime.fromisoformat(str(created).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class SeenMessages:
+    """
+    Bounded set of message ids plus a per-room high-water mark.
+
+    Ids live in an insertion-ordered ring of at most `capacity` entries.
+    When an id falls out of the ring, its room's high-water mark is raised
+    to its `created` time, and the mark then rejects anything at or before
+    it, so evicting ids never causes old messages to be answered twice.
+    Messages still in the ring are judged by id alone, so ones delivered
+    out of order (concurrent webhooks) are not dropped.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = max(1, capacity)
+        self._ids = OrderedDict()
+        self._high_water = {}
+        self._lock = threading.Lock()
+
+    def add(self, message_id: str, room_id: str = None, created=None) -> bool:
+        """
+        Record a message.
+
+        Returns:
+            True if the message is new, False if it was already seen
+        """
+        created = parse_created(created)
+        with self._lock:
+            if self._seen(message_id, room_id, created):
+                return False
+
+            self._ids[message_id] = (room_id, created)
+            while len(self._ids) > self.capacity:
+                _, (evicted_room, evicted_created) = self._ids.popitem(last=False)
+                if evicted_room and evicted_created:
+                    mark = self._high_water.get(evicted_room)
+                    if mark is None or evicted_created > mark:
+                        self._high_water[evicted_room] = evicted_created
+            return True
+
+    def _seen(self, message_id, room_id, created) -> bool:
+        if message_id in self._ids:
+            return True
+        mark = self._high_water.get(room_id)
+        return bool(mark and created and created <= mark)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._ids)
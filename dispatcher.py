@@ -0,0 +1,213 @@
+"""
+Message Dispatcher
+Fans message handling out to a bounded worker pool (threads or asyncio
+tasks) while keeping each room's messages in order. When all workers
+are busy, waiting rooms are served by priority, with aging.
+"""
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+# Task priorities (lower runs first)
+PRIORITY_COMMAND = 0       # local commands such as /help and /clear
+PRIORITY_INTERACTIVE = 1   # direct messages and @mentions
+PRIORITY_BULK = 2          # other group-room traffic
+
+
+def _deadline(priority: int, aging: float) -> float:
+    """
+    Heap key for a task submitted now.
+
+    Each priority level is worth `aging` seconds of waiting, so a
+    low-priority task overtakes newer high-priority ones once it has
+    waited long enough and can't be starved.
+    """
+    return time.monotonic() + priority * aging
+
+
+class RoomDispatcher:
+    """
+    Run tasks on a shared thread pool with per-room ordering.
+
+    At most `max_workers` tasks run at once across all rooms, and at most
+    `max_per_room` at once within a room. Tasks for a room start in the
+    order they were submitted; with the default `max_per_room=1` they also
+    finish in that order. Among rooms waiting for a worker, the task with
+    the best priority goes first, where each priority level counts as
+    `aging` seconds of waiting.
+    """
+
+    def __init__(self, max_workers: int = 8, max_per_room: int = 1, aging: float = 10):
+        self.max_per_room = max(1, max_per_room)
+        self.aging = aging
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._ready = threading.Condition(self._lock)
+        # room_id -> [pending tasks deque, number of running tasks]
+        self._rooms = {}
+        # Tasks whose room has a free slot: (deadline, seq, room_id, task)
+        self._heap = []
+        self._seq = itertools.count()
+        self._stopped = False
+        self._workers = [threading.Thread(target=self._work, name=f"dispatch_{i}", daemon=True)
+                         for i in range(max(1, max_workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, room_id: str, fn, *args, priority: int = PRIORITY_BULK, **kwargs):
+        """Queue `fn(*args, **kwargs)` behind earlier tasks for the room."""
+        task = (_deadline(priority, self.aging), fn, args, kwargs)
+        with self._lock:
+            state = self._rooms.setdefault(room_id, [deque(), 0])
+            if state[1] >= self.max_per_room:
+                state[0].append(task)
+                return
+            state[1] += 1
+            self._push(room_id, task)
+
+    def _push(self, room_id: str, task):
+        heapq.heappush(self._heap, (task[0], next(self._seq), room_id, task))
+        self._ready.notify()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._heap and not self._stopped:
+                    self._ready.wait()
+                if self._stopped:
+                    return
+                _, _, room_id, task = heapq.heappop(self._heap)
+            self._run(room_id, task)
+
+    def _run(self, room_id: str, task):
+        _, fn, args, kwargs = task
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in dispatched task for room {room_id}: {e}")
+        finally:
+            with self._lock:
+                state = self._rooms[room_id]
+                if state[0]:
+                    # Keeps its original deadline, so time spent queued
+                    # behind the room's earlier messages counts as aging
+                    self._push(room_id, state[0].popleft())
+                else:
+                    state[1] -= 1
+                    if state[1] == 0:
+                        del self._rooms[room_id]
+                        self._idle.notify_all()
+
+    def pending(self) -> int:
+        """Number of tasks waiting for a worker or behind a busy room."""
+        with self._lock:
+            return len(self._heap) + sum(len(state[0]) for state in self._rooms.values())
+
+    def shutdown(self, wait: bool = True):
+        """Stop the pool, optionally waiting for all queued tasks to finish."""
+        with self._lock:
+            if wait:
+                self._idle.wait_for(lambda: not self._rooms)
+            else:
+                self._heap.clear()
+                for state in self._rooms.values():
+                    state[0].clear()
+            self._stopped = True
+            self._ready.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+class AsyncRoomDispatcher:
+    """
+    Asyncio counterpart of RoomDispatcher.
+
+    Each submitted coroutine runs as a task on `loop` instead of holding a
+    thread, with the same global and per-room limits, per-room start
+    order and priorities with aging. Scheduling state is only touched on
+    the loop, so it needs no locking.
+    """
+
+    def __init__(self, loop, max_workers: int = 8, max_per_room: int = 1, aging: float = 10):
+        self.max_workers = max(1, max_workers)
+        self.max_per_room = max(1, max_per_room)
+        self.aging = aging
+        self._loop = loop
+        # room_id -> [pending tasks deque, number of running tasks]
+        self._rooms = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = set()
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, room_id: str, coro_fn, *args, priority: int = PRIORITY_BULK, **kwargs):
+        """Queue `coro_fn(*args, **kwargs)` behind earlier tasks for the room."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        task = (_deadline(priority, self.aging), coro_fn, args, kwargs, future)
+        self._loop.call_soon_threadsafe(self._enqueue, room_id, task)
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _enqueue(self, room_id: str, task):
+        state = self._rooms.setdefault(room_id, [deque(), 0])
+        if state[1] >= self.max_per_room:
+            state[0].append(task)
+            return
+        state[1] += 1
+        heapq.heappush(self._heap, (task[0], next(self._seq), room_id, task))
+        self._start_ready()
+
+    def _start_ready(self):
+        while self._heap and len(self._running) < self.max_workers:
+            _, _, room_id, task = heapq.heappop(self._heap)
+            self._running.add(self._loop.create_task(self._run(room_id, task)))
+
+    async def _run(self, room_id: str, task):
+        _, coro_fn, args, kwargs, future = task
+        try:
+            if future.set_running_or_notify_cancel():
+                await coro_fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in dispatched task for room {room_id}: {e}")
+        finally:
+            if not future.done():
+                future.set_result(None)
+            self._running.discard(asyncio.current_task())
+            state = self._rooms[room_id]
+            if state[0]:
+                # The room's next task joins the queue before the freed
+                # slot is given away, keeping its original deadline
+                next_task = state[0].popleft()
+                heapq.heappush(self._heap, (next_task[0], next(self._seq), room_id, next_task))
+            else:
+                state[1] -= 1
+                if state[1] == 0:
+                    del self._rooms[room_id]
+            self._start_ready()
+
+    def pending(self) -> int:
+        """Number of tasks queued or running."""
+        with self._lock:
+            return len(self._futures)
+
+    def shutdown(self, wait: bool = True):
+        """Wait for (or cancel) all submitted tasks."""
+        with self._lock:
+            futures = list(self._futures)
+        if wait:
+            concurrent.futures.wait(futures)
+            return
+        for future in futures:
+            future.cancel()
+        self._loop.call_soon_threadsafe(lambda: [task.cancel() for task in list(self._running)])
@@ -0,0 +1,427 @@
+"""
+Conversation History
+Per-room message history trimmed to a token budget rather than a fixed
+number of messages, held in a bounded store that evicts idle rooms and
+can persist to SQLite so history survives restarts.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+import metrics
+
+# Rough chat-format overhead per message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Marks where an over-budget message was shortened
+TRUNCATION_MARK = "\n…[truncated]…\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate a message's token count (~4 characters per token)."""
+    return MESSAGE_OVERHEAD_TOKENS + (len(text) + 3) // 4
+
+
+def history_budget(model: str) -> int:
+    """
+    Token budget for a room's history when talking to `model`.
+
+    HISTORY_TOKEN_BUDGET sets the default; HISTORY_TOKEN_BUDGETS overrides
+    it per model, e.g. "haiku-4.5=20000,llama3:8b=3000".
+    """
+    for entry in os.environ.get("HISTORY_TOKEN_BUDGETS", "").split(","):
+        name, _, budget = entry.strip().rpartition("=")
+        if name == model and budget.isdigit():
+            return int(budget)
+    return int(os.environ.get("HISTORY_TOKEN_BUDGET", "6000"))
+
+
+class Conversation:
+    """
+    One room's history, with each message's token estimate cached.
+
+    Appending and trimming only touch the messages involved, so keeping
+    the running total never re-counts the whole history.
+    """
+
+    def __init__(self):
+        self.messages = deque()
+        self._tokens = deque()
+        self.tokens = 0
+        self.bytes = 0
+
+    def append(self, role: str, content: str):
+        """Add a message to the end of the history."""
+        count = estimate_tokens(content)
+        self.messages.append({"role": role, "content": content})
+        self._tokens.append(count)
+        self.tokens += count
+        self.bytes += len(content.encode())
+
+    def trim(self, budget: int):
+        """
+        Drop the oldest messages until the history fits in `budget` tokens.
+
+        The latest exchange (the last user message and what follows it) is
+        always kept; if it alone is over budget, its messages are shortened
+        instead, so a follow-up still has the context.
+        """
+        latest = len(self.messages) - 1
+        while latest > 0 and self.messages[latest]["role"] != "user":
+            latest -= 1
+        keep = len(self.messages) - max(latest, 0)
+
+        while len(self.messages) > keep and self.tokens > budget:
+            self._pop_oldest()
+        # Never start the history halfway through an exchange
+        while len(self.messages) > keep and self.messages[0]["role"] != "user":
+            self._pop_oldest()
+
+        while self.messages and self.tokens > budget:
+            ratio = budget / self.tokens
+            shortened = [self._shorten(i, int(len(message["content"]) * ratio))
+                         for i, message in enumerate(list(self.messages))]
+            if not any(shortened):
+                break
+
+    def _shorten(self, index: int, chars: int) -> bool:
+        """Cut a message down to about `chars` characters, keeping its start and end."""
+        content = self.messages[index]["content"]
+        chars = max(chars - len(TRUNCATION_MARK), 0)
+        if chars >= len(content):
+            return False
+        head = (chars + 1) // 2
+        shortened = content[:head] + TRUNCATION_MARK + (content[-(chars - head):] if chars > head else "")
+        if len(shortened) >= len(content):
+            return False
+        count = estimate_tokens(shortened)
+        self.tokens += count - self._tokens[index]
+        self.bytes += len(shortened.encode()) - len(content.encode())
+        self._tokens[index] = count
+        self.messages[index] = {"role": self.messages[index]["role"], "content": shortened}
+        return True
+
+    def _pop_oldest(self):
+        message = self.messages.popleft()
+        self.tokens -= self._tokens.popleft()
+        self.bytes -= len(message["content"].encode())
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+class HistoryBackend:
+    """
+    Durable storage behind a ConversationStore.
+
+    The store loads a room from its backend the first time the room is
+    used (or after it was evicted) and passes along every append and
+    clear. Implementations should not block on writes.
+    """
+
+    def load(self, room_id: str) -> list:
+        """Return a room's stored history as (role, content) pairs, oldest first."""
+        return []
+
+    def append(self, room_id: str, entries):
+        """Persist (role, content) pairs appended to a room's history."""
+
+    def clear(self, room_id: str):
+        """Delete a room's stored history."""
+
+    def close(self):
+        """Flush pending writes and release resources."""
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    SQLite history with write-behind.
+
+    append() and clear() only enqueue; a writer thread commits whatever
+    has queued up (at most `batch_size` operations) in one transaction, so
+    writes batch up naturally under load. Until they are committed, a
+    room's queued writes are also kept in memory, and load() merges them
+    with what is on disk instead of waiting for the writer. It returns the
+    newest `keep` messages of a room; older rows are pruned as rooms are
+    written.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, keep: int = 200):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.keep = keep
+        self._queue = queue.Queue()
+        # room_id -> queued, not yet committed operations, oldest first
+        self._pending = {}
+        # Held while reading, and while committing and settling a batch,
+        # so a load sees each write either on disk or pending, never both
+        self._read_lock = threading.Lock()
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._reader = self._connect()
+        self._reader.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL
+            )""")
+        self._reader.execute("CREATE INDEX IF NOT EXISTS messages_room ON messages (room_id, id)")
+        self._reader.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def load(self, room_id: str) -> list:
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT role, content FROM messages WHERE room_id = ? ORDER BY id DESC LIMIT ?",
+                (room_id, self.keep),
+            ).fetchall()[::-1]
+            pending = list(self._pending.get(room_id, ()))
+        for op, _, entries, _ in pending:
+            rows = [] if op == "clear" else rows + entries
+        metrics.incr("history_loads")
+        return rows[-self.keep:] if self.keep else rows
+
+    def append(self, room_id: str, entries):
+        self._enqueue(("append", room_id, list(entries), time.time()))
+
+    def clear(self, room_id: str):
+        self._enqueue(("clear", room_id, None, None))
+
+    def _enqueue(self, op):
+        with self._read_lock:
+            self._pending.setdefault(op[1], deque()).append(op)
+        self._queue.put(op)
+
+    def close(self):
+        with self._read_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            ops = [op for op in batch if op is not None]
+            try:
+                self._write_batch(connection, ops)
+            except sqlite3.Error as e:
+                connection.rollback()
+                print(f"Error writing conversation history: {e}")
+                with self._read_lock:
+                    self._settle(ops)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if batch[-1] is None:
+                connection.close()
+                return
+
+    def _write_batch(self, connection: sqlite3.Connection, batch):
+        written = set()
+        for op, room_id, entries, created in batch:
+            if op == "clear":
+                connection.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+                written.discard(room_id)
+                continue
+            connection.executemany(
+                "INSERT INTO messages (room_id, role, content, created) VALUES (?, ?, ?, ?)",
+                [(room_id, role, content, created) for role, content in entries],
+            )
+            written.add(room_id)
+
+        # Keep only what load() could ever return
+        for room_id in written:
+            connection.execute(
+                """DELETE FROM messages WHERE room_id = ? AND id <= (
+                    SELECT id FROM messages WHERE room_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+                (room_id, room_id, self.keep),
+            )
+        # Commit and settle together (see _read_lock)
+        with self._read_lock:
+            connection.commit()
+            self._settle(batch)
+        metrics.incr("history_write_batches")
+
+    def _settle(self, batch):
+        """Forget committed (or failed) operations; call with _read_lock held."""
+        for op in batch:
+            pending = self._pending.get(op[1])
+            if pending and pending[0] is op:
+                pending.popleft()
+                if not pending:
+                    del self._pending[op[1]]
+
+
+class ConversationStore:
+    """
+    Room histories with a capacity and an idle TTL.
+
+    Rooms are kept in least-recently-used order, so both limits are
+    enforced by dropping rooms from the front: O(1) per access and per
+    eviction. Holds at most `capacity` rooms; a room untouched for
+    `idle_ttl` seconds is dropped (0 disables the TTL). Histories are
+    trimmed to `budget` tokens. With a `backend`, every change is written
+    through, and a room not in memory is loaded from it when its messages
+    are read (see preload()); appending to such a room only writes
+    through, so no write ever waits for a load.
+    """
+
+    def __init__(self, capacity: int = 1000, idle_ttl: float = 86400, budget: int = None,
+                 backend: HistoryBackend = None):
+        self.capacity = max(1, capacity)
+        self.idle_ttl = idle_ttl
+        self.budget = budget
+        self.backend = backend
+        # room_id -> (Conversation, last used)
+        self._rooms = OrderedDict()
+        self.bytes = 0
+        self._lock = threading.Lock()
+        # Bumped by changes to rooms not in memory, so preload() can
+        # tell its read went stale
+        self._changes = 0
+
+    def preload(self, room_id: str):
+        """
+        Load a room from the backend without holding the store lock.
+
+        The backend read is the slow part of a room's first access; call
+        this off the event loop before messages() so it doesn't hold up
+        other rooms. Does nothing if the room is already in memory.
+        """
+        if not self.backend or room_id in self:
+            return
+        with self._lock:
+            changes = self._changes
+        rows = self.backend.load(room_id)
+        with self._lock:
+            if room_id not in self._rooms and changes == self._changes:
+                self._create(room_id, rows)
+
+    def messages(self, room_id: str) -> list:
+        """A room's history as a list of chat messages (empty if none)."""
+        with self._lock:
+            conversation = self._touch(room_id)
+            if conversation is None and self.backend:
+                conversation = self._create(room_id)
+            return list(conversation.messages) if conversation else []
+
+    def extend(self, room_id: str, entries):
+        """Append (role, content) entries, oldest first, to a room's history."""
+        entries = list(entries)
+        with self._lock:
+            conversation = self._touch(room_id)
+            if conversation is None and self.backend:
+                # Not in memory: write through only; the next load of the
+                # room picks the entries up from the backend
+                self._changes += 1
+                self.backend.append(room_id, entries)
+                return
+            if conversation is None:
+                conversation = self._create(room_id)
+            before = conversation.bytes
+            for role, content in entries:
+                conversation.append(role, content)
+            if self.budget is not None:
+                conversation.trim(self.budget)
+            self.bytes += conversation.bytes - before
+            self._report()
+            if self.backend:
+                self.backend.append(room_id, entries)
+
+    def clear(self, room_id: str):
+        """Forget a room's history."""
+        with self._lock:
+            self._changes += 1
+            entry = self._rooms.pop(room_id, None)
+            if entry:
+                self.bytes -= entry[0].bytes
+            self._report()
+            if self.backend:
+                self.backend.clear(room_id)
+
+    def close(self):
+        """Flush and close the backend, if any."""
+        if self.backend:
+            self.backend.close()
+
+    def _create(self, room_id: str, rows: list = None) -> Conversation:
+        """Start a room's in-memory history, seeded from `rows` or the backend."""
+        conversation = Conversation()
+        if rows is None and self.backend:
+            rows = self.backend.load(room_id)
+        if rows:
+            for role, content in rows:
+                conversation.append(role, content)
+            if self.budget is not None:
+                conversation.trim(self.budget)
+        self._rooms[room_id] = (conversation, time.monotonic())
+        self.bytes += conversation.bytes
+        while len(self._rooms) > self.capacity:
+            self._drop_oldest()
+        self._report()
+        return conversation
+
+    def _touch(self, room_id: str):
+        """Return a room's conversation, marking it recently used."""
+        self._expire()
+        entry = self._rooms.get(room_id)
+        if entry is None:
+            return None
+        self._rooms[room_id] = (entry[0], time.monotonic())
+        self._rooms.move_to_end(room_id)
+        return entry[0]
+
+    def _expire(self):
+        if not self.idle_ttl:
+            return
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._rooms:
+            _, last_used = next(iter(self._rooms.values()))
+            if last_used > cutoff:
+                break
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, (conversation, _) = self._rooms.popitem(last=False)
+        self.bytes -= conversation.bytes
+        metrics.incr("conversations_evicted")
+        self._report()
+
+    def _report(self):
+        metrics.set_gauge("conversations_resident", len(self._rooms))
+        metrics.set_gauge("conversation_bytes", self.bytes)
+
+    def __contains__(self, room_id: str) -> bool:
+        with self._lock:
+            return room_id in self._rooms
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rooms)
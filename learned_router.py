@@ -0,0 +1,163 @@
+"""
+Learned Search Router
+A tiny logistic-regression model over hashed word and character n-grams
+that predicts whether a message needs web search. Trained offline with
+NumPy from labeled (or logged) routing decisions; scoring a message is
+a handful of hash lookups and one dot product.
+
+Usage:
+    python learned_router.py train decisions.jsonl [more.jsonl ...] [--out router_model.npz]
+"""
+import argparse
+import json
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+
+def features(text: str) -> list:
+    """Word unigrams and bigrams plus character trigrams of a message."""
+    text = text.lower()
+    words = re.findall(r"\w+|[?!]", text)
+    found = [f"w:{w}" for w in words]
+    found.extend(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    padded = f" {' '.join(words)} "
+    found.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return found
+
+
+def hash_features(text: str, dims: int):
+    """
+    Hash a message's features into `dims` buckets.
+
+    Returns:
+        (indices, values): the non-zero buckets and their signed,
+        L2-normalized counts
+    """
+    counts = Counter()
+    for feature in features(text):
+        h = zlib.crc32(feature.encode())
+        counts[h % dims] += 1.0 if h & 0x80000000 else -1.0
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.linalg.norm(values)
+    return indices, values / norm if norm else values
+
+
+class LearnedRouter:
+    """
+    Logistic regression over hashed features.
+
+    probability() is the model's estimate that a message needs web
+    search; should_search() compares it with `threshold`.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float = 0.0, threshold: float = 0.5):
+        self.weights = weights.astype(np.float32)
+        self.dims = len(weights)
+        self.bias = float(bias)
+        self.threshold = threshold
+
+    def probability(self, text: str) -> float:
+        indices, values = hash_features(text, self.dims)
+        z = float(self.weights[indices] @ values) + self.bias
+        return float(1.0 / (1.0 + np.exp(-z)))
+
+    def should_search(self, text: str) -> bool:
+        return self.probability(text) >= self.threshold
+
+    @classmethod
+    def train(cls, texts, labels, dims: int = 1 << 16, epochs: int = 300,
+              learning_rate: float = 2.0, l2: float = 1e-4) -> "LearnedRouter":
+        """
+        Fit weights with full-batch gradient descent.
+
+        Classes are weighted so that a corpus with few searches still
+        learns to recognise them.
+        """
+        labels = np.asarray(labels, dtype=np.float32)
+        # Sparse design matrix as (row, column, value) triples
+        rows, columns, values = [], [], []
+        for row, text in enumerate(texts):
+            indices, row_values = hash_features(text, dims)
+            rows.append(np.full(len(indices), row))
+            columns.append(indices)
+            values.append(row_values)
+        rows, columns, values = np.concatenate(rows), np.concatenate(columns), np.concatenate(values)
+
+        positives = max(labels.sum(), 1.0)
+        negatives = max(len(labels) - labels.sum(), 1.0)
+        sample_weights = np.where(labels > 0, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+
+        weights = np.zeros(dims, dtype=np.float32)
+        bias = 0.0
+        for _ in range(epochs):
+            z = np.bincount(rows, weights=weights[columns] * values, minlength=len(labels)) + bias
+            error = (1.0 / (1.0 + np.exp(-z)) - labels) * sample_weights / len(labels)
+            gradient = np.bincount(columns, weights=error[rows] * values, minlength=dims)
+            weights -= learning_rate * (gradient + l2 * weights).astype(np.float32)
+            bias -= learning_rate * float(error.sum())
+        return cls(weights, bias)
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = None) -> "LearnedRouter":
+        with np.load(path) as model:
+            saved_threshold = float(model["threshold"])
+            return cls(model["weights"], float(model["bias"]),
+                       saved_threshold if threshold is None else threshold)
+
+
+def load_examples(paths) -> tuple:
+    """Read texts and search labels from JSON-lines files (eval corpus or decision log)."""
+    texts, labels = [], []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                texts.append(row["text"])
+                labels.append(bool(row["search"]))
+    return texts, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the learned search router.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    train = subcommands.add_parser("train", help="Fit a model on labeled JSON lines")
+    train.add_argument("data", nargs="+", help='JSON lines with "text" and "search" fields')
+    train.add_argument("--out", default="router_model.npz")
+    train.add_argument("--dims", type=int, default=1 << 16, help="Hashed feature buckets")
+    train.add_argument("--epochs", type=int, default=300)
+    train.add_argument("--threshold", type=float, default=0.5, help="Search when probability >= this")
+    train.add_argument("--holdout", type=float, default=0.2, help="Fraction kept back to report accuracy")
+    args = parser.parse_args()
+
+    texts, labels = load_examples(args.data)
+    order = np.random.default_rng(0).permutation(len(texts))
+    split = int(len(texts) * (1 - args.holdout)) if args.holdout else len(texts)
+    train_rows, test_rows = order[:split], order[split:]
+
+    router = LearnedRouter.train([texts[i] for i in train_rows], [labels[i] for i in train_rows],
+                                 dims=args.dims, epochs=args.epochs)
+    router.threshold = args.threshold
+    print(f"Trained on {len(train_rows)} examples ({sum(labels[i] for i in train_rows)} searches)")
+
+    if len(test_rows):
+        predicted = [router.should_search(texts[i]) for i in test_rows]
+        actual = [labels[i] for i in test_rows]
+        tp = sum(p and a for p, a in zip(predicted, actual))
+        print(f"Held out {len(test_rows)}: accuracy {sum(p == a for p, a in zip(predicted, actual)) / len(actual):.3f}, "
+              f"precision {tp / max(sum(predicted), 1):.3f}, recall {tp / max(sum(actual), 1):.3f}")
+
+    router.save(args.out)
+    print(f"Saved model to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
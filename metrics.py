@@ -0,0 +1,38 @@
+"""
+Bot Metrics
+Thread-safe in-process counters and gauges for API usage and memory.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def incr(name: str, amount: int = 1):
+    """Add `amount` to a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name: str, value):
+    """Record the current value of a gauge."""
+    with _lock:
+        _gauges[name] = value
+
+
+def snapshot() -> dict:
+    """Return all counters and gauges, plus derived ratios."""
+    with _lock:
+        data = {**_counters, **_gauges}
+    
+    handled = data.get("messages_handled", 0)
+    if handled:
+        data["webex_api_calls_per_message"] = round(data.get("webex_api_calls", 0) / handled, 2)
+    return data
+
+
+def log_summary():
+    """Print a one-line metrics summary."""
+    data = snapshot()
+    print("📊 " + ", ".join(f"{k}={v}" for k, v in sorted(data.items())))
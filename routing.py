@@ -0,0 +1,348 @@
+"""
+Search Routing
+Decides whether a message should go to web search instead of plain chat.
+Rules live in a JSON file (SEARCH_RULES_PATH) that is compiled into a
+few regular expressions when loaded and reloaded whenever it changes.
+With ROUTER=learned a trained model (learned_router.py) decides instead.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+RULES_PATH = os.environ.get(
+    "SEARCH_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_rules.json"))
+RELOAD_INTERVAL = float(os.environ.get("SEARCH_RULES_RELOAD_INTERVAL", "5"))
+ROUTER = os.environ.get("ROUTER", "rules").lower()
+ROUTER_MODEL_PATH = os.environ.get("ROUTER_MODEL_PATH", "router_model.npz")
+ROUTER_BORDERLINE_MARGIN = float(os.environ.get("ROUTER_BORDERLINE_MARGIN", "0.15"))
+ROUTING_LOG_PATH = os.environ.get("ROUTING_LOG_PATH")
+
+# ASCII characters a word can follow: everything but [A-Za-z0-9_]
+_ASCII_SEPARATORS = "".join(re.escape(chr(i)) for i in range(128) if not (chr(i).isalnum() or chr(i) == "_"))
+
+
+class Route(NamedTuple):
+    """Routing decision for one message."""
+    search: bool
+    score: float
+    rules: tuple
+    # Close enough to the threshold that either path could be right
+    borderline: bool = False
+
+
+def _trie_pattern(words) -> str:
+    """
+    Build a regex matching any of `words`, factored into a prefix trie.
+
+    "status|stock|score" becomes "s(?:core|t(?:atus|ock))", so the regex
+    engine tests each character once per position instead of once per
+    keyword.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word ends here but longer ones continue: the rest is optional
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def _searcher(pattern: re.Pattern):
+    """
+    pattern.search, or an equivalent that is faster for a leading \\b.
+
+    A leading \\b stops the regex engine from skipping ahead to candidate
+    positions with its fast prefix search. Without it the rest of the
+    pattern is found quickly, and each place it matches is then checked
+    with the full pattern.
+    """
+    if not pattern.pattern.startswith(r"\b"):
+        return pattern.search
+    loose = re.compile(pattern.pattern[2:], pattern.flags)
+
+    def search(text: str):
+        pos = 0
+        while candidate := loose.search(text, pos):
+            match = pattern.match(text, candidate.start())
+            if match:
+                return match
+            pos = candidate.start() + 1
+        return None
+
+    return search
+
+
+class SearchRules:
+    """
+    A compiled rule set.
+
+    Keywords only match whole words (optionally followed by
+    `keyword_suffix`, so "error" also matches "errors"), patterns are
+    regular expressions, and the question rule only applies to messages
+    longer than its `min_length` that contain a '?'. Every rule that
+    matches adds its weight once; a message goes to web search when the
+    total reaches `threshold`. A weight of 0 disables a rule and a
+    negative weight counts against searching. A score within
+    `borderline_margin` of the threshold is flagged as borderline.
+    """
+
+    def __init__(self, config: dict):
+        self.threshold = float(config.get("threshold", 1.0))
+        self.borderline_margin = float(config.get("borderline_margin", 0.0))
+        self.keywords = {word.lower(): float(weight)
+                         for word, weight in config.get("keywords", {}).items() if weight}
+        self.patterns = [(name, re.compile(rule["regex"]), float(rule.get("weight", 1.0)))
+                         for name, rule in config.get("patterns", {}).items() if rule.get("weight", 1.0)]
+        question = config.get("question") or {}
+        self.question = re.compile(question["regex"]) if question.get("regex") else None
+        self.question_weight = float(question.get("weight", 1.0)) if self.question else 0.0
+        self.question_min_length = int(question.get("min_length", 20))
+        # Past the borderline band nothing can change the outcome, so stop
+        # checking there. Negative weights can still pull a passing score
+        # down, so only stop early when every weight is positive.
+        weights = [*self.keywords.values(), *(w for _, _, w in self.patterns), self.question_weight or 1.0]
+        positive = all(w > 0 for w in weights)
+        self._stop_at = self.threshold + self.borderline_margin if positive else float("inf")
+        # Without the borderline flag, the decision is settled at the threshold
+        self._decided_at = self.threshold if positive else float("inf")
+
+        # Group 1 is the keyword itself, without any suffix. ASCII text is
+        # scanned from the separator before each word (with a space put in
+        # front of the text): unlike a (?<!\w) lookbehind, a leading
+        # character class lets the regex engine skip to candidate positions
+        # in C, which makes the scan about twice as fast on long messages.
+        suffix = config.get("keyword_suffix", "")
+        keyword = rf"({_trie_pattern(self.keywords)}){suffix}(?!\w)"
+        self._keyword_matcher = re.compile(rf"(?<!\w){keyword}" if self.keywords else "(?!)")
+        self._ascii_keyword_matcher = re.compile(rf"[{_ASCII_SEPARATORS}]{keyword}" if self.keywords else "(?!)")
+        self._keyword_rules = {word: (f"keyword:{word}", weight) for word, weight in self.keywords.items()}
+        # Each pattern is searched on its own: separately, their literal
+        # prefixes keep the regex engine's fast prefix search, which one
+        # combined alternation loses on long messages
+        self._pattern_rules = [(f"pattern:{name}", _searcher(pattern), weight)
+                               for name, pattern, weight in self.patterns]
+        self._question_search = _searcher(self.question) if self.question else None
+
+    def classify(self, text: str, borderline: bool = True) -> Route:
+        """
+        Score a message against the rules, stopping once the outcome is settled.
+
+        With `borderline=False` the borderline flag is not needed (and left
+        False), so checking stops as soon as the search decision is known.
+        """
+        text_lower = text.lower()
+        stop_at = self._stop_at if borderline else self._decided_at
+        score = 0.0
+        fired = []
+
+        if text_lower.isascii():
+            matches = self._ascii_keyword_matcher.finditer(" " + text_lower)
+        else:
+            matches = self._keyword_matcher.finditer(text_lower)
+        for match in matches:
+            rule, weight = self._keyword_rules[match.group(1)]
+            if rule in fired:
+                continue
+            fired.append(rule)
+            score += weight
+            if score >= stop_at:
+                break
+
+        if score < stop_at:
+            for rule, search, weight in self._pattern_rules:
+                if search(text_lower):
+                    fired.append(rule)
+                    score += weight
+                    if score >= stop_at:
+                        break
+
+        if (score < stop_at and self.question and '?' in text and len(text) > self.question_min_length
+                and self._question_search(text_lower)):
+            fired.append("question")
+            score += self.question_weight
+
+        borderline = borderline and abs(score - self.threshold) < self.borderline_margin
+        return Route(score >= self.threshold, score, tuple(fired), borderline)
+
+    @staticmethod
+    def with_overrides(config: dict, overrides: dict) -> "SearchRules":
+        """Compile `config` with one room's overrides merged on top."""
+        merged = dict(config)
+        for key in ("keywords", "patterns"):
+            merged[key] = {**config.get(key, {}), **overrides.get(key, {})}
+        for key in ("threshold", "borderline_margin", "keyword_suffix", "question"):
+            if key in overrides:
+                merged[key] = overrides[key]
+        return SearchRules(merged)
+
+
+class RulesFile:
+    """
+    Search rules loaded from a JSON file and hot-reloaded.
+
+    At most every `reload_interval` seconds the file's modification time
+    is checked; when it changed the file is recompiled, including one
+    rule set per room listed under "rooms". A file that fails to parse or
+    compile is reported and the previous rules stay in effect.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 5):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime = None
+        self._next_check = 0.0
+        self._rules = SearchRules({})
+        self._room_rules = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def rules(self, room_id: str = None) -> SearchRules:
+        """The rule set for a room (the default rules if it has no overrides)."""
+        if time.monotonic() >= self._next_check:
+            self._check()
+        return self._room_rules.get(room_id, self._rules) if self._room_rules else self._rules
+
+    def _check(self):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_check:
+                self._next_check = now + self.reload_interval
+                self._reload_if_changed()
+
+    def reload(self):
+        """Load the rules file now."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            self._reload_if_changed(force=True)
+
+    def _reload_if_changed(self, force: bool = False):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self._mtime is not None or force:
+                print(f"⚠️ Search rules unavailable ({e}); keeping current rules")
+            self._mtime = None
+            return
+        if mtime == self._mtime and not force:
+            return
+        self._mtime = mtime
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                config = json.load(f)
+            rules = SearchRules(config)
+            room_rules = {room_id: SearchRules.with_overrides(config, overrides)
+                          for room_id, overrides in config.get("rooms", {}).items()}
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            print(f"⚠️ Invalid search rules in {self.path}: {e}; keeping current rules")
+            return
+        self._rules, self._room_rules = rules, room_rules
+        print(f"🔀 Loaded search rules from {self.path} "
+              f"({len(rules.keywords)} keywords, {len(rules.patterns)} patterns, {len(room_rules)} room overrides)")
+
+
+class DecisionLog:
+    """
+    Append-only JSON-lines log of routing decisions.
+
+    Each line has the message text and the "search" decision, the same
+    format learned_router.py trains on: correct the labels that were
+    wrong, then train a model on the log.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, text: str, route: Route, room_id: str = None):
+        line = json.dumps({
+            "time": time.time(),
+            "room_id": room_id,
+            "text": text,
+            "search": route.search,
+            "score": round(route.score, 4),
+            "rules": list(route.rules),
+            "borderline": route.borderline,
+            "router": ROUTER,
+        })
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+def _load_learned_router():
+    """The trained model when ROUTER=learned, or None to use the rules."""
+    if ROUTER != "learned":
+        return None
+    from learned_router import LearnedRouter
+    threshold = os.environ.get("ROUTER_THRESHOLD")
+    try:
+        router = LearnedRouter.load(ROUTER_MODEL_PATH, float(threshold) if threshold else None)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"⚠️ Could not load router model {ROUTER_MODEL_PATH} ({e}); using search rules")
+        return None
+    print(f"🔀 Routing with learned model {ROUTER_MODEL_PATH} (threshold {router.threshold:g})")
+    return router
+
+
+_rules_file = RulesFile(RULES_PATH, RELOAD_INTERVAL)
+_learned_router = _load_learned_router()
+_decision_log = DecisionLog(ROUTING_LOG_PATH) if ROUTING_LOG_PATH else None
+
+
+def classify(text: str, room_id: str = None, borderline: bool = True) -> Route:
+    """
+    Score a message with the learned model, or the current rules for its room.
+
+    Pass `borderline=False` when only the search decision matters; the
+    rules can then stop at the first rule that settles it.
+    """
+    if _learned_router is not None:
+        probability = _learned_router.probability(text)
+        borderline = abs(probability - _learned_router.threshold) < ROUTER_BORDERLINE_MARGIN
+        return Route(probability >= _learned_router.threshold, probability, ("model",), borderline)
+    return _rules_file.rules(room_id).classify(text, borderline)
+
+
+def route_message(text: str, room_id: str = None, borderline: bool = True) -> Route:
+    """
+    Decide between web search and chat for an incoming message.
+
+    Adds up the weights of the matching rules in search_rules.json:
+    1. Keywords suggesting need for current/real-time info
+    2. Patterns suggesting user is struggling
+    3. Questions that likely need external lookup
+    or, with ROUTER=learned, asks the trained model. The decision is
+    logged when ROUTING_LOG_PATH is set. Pass `borderline=False` if the
+    caller doesn't use Route.borderline (logged decisions always get it).
+    """
+    route = classify(text, room_id, borderline or _decision_log is not None)
+    if _decision_log:
+        _decision_log.write(text, route, room_id)
+    if route.search:
+        borderline = ", borderline" if route.borderline else ""
+        print(f"  🔍 Auto-search triggered by {', '.join(route.rules)} (score {route.score:g}{borderline})")
+    elif route.borderline:
+        print(f"  🔀 Borderline message routed to chat ({', '.join(route.rules) or 'no rules'}, "
+              f"score {route.score:g})")
+    return route
+
+
+def should_use_web_search(text: str, room_id: str = None) -> bool:
+    """Determine if the message should trigger automatic web search. See route_message()."""
+    return route_message(text, room_id, borderline=False).search
@@ -0,0 +1,88 @@
+"""
+Room Poll Scheduler
+Decides which rooms are worth polling, so API usage follows actual
+traffic instead of the number of rooms the bot is in.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+from dedup import parse_created
+
+
+class RoomScheduler:
+    """
+    Activity-driven poll schedule built from each room's `lastActivity`.
+
+    A room is due right away when its lastActivity moves past the value
+    it had when last polled. Otherwise it is re-checked on an interval
+    that starts at `min_interval` and doubles after every poll that finds
+    nothing new, up to `max_interval`. Activity from before `start_time`
+    (default: now) does not make a room due.
+    """
+
+    def __init__(self, min_interval: float = 2, max_interval: float = 300, start_time: datetime = None):
+        self.start_time = start_time or datetime.now(timezone.utc)
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        # Newest lastActivity across all rooms, as of the last listing
+        self.activity_mark = None
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, room_id: str, last_activity, now: float = None):
+        """Record a room's lastActivity from a rooms.list result."""
+        now = time.monotonic() if now is None else now
+        last_activity = parse_created(last_activity)
+        with self._lock:
+            state = self._rooms.get(room_id)
+            if state is None:
+                state = self._rooms[room_id] = {
+                    "last_activity": None,
+                    "polled_activity": self.start_time,
+                    "interval": self.min_interval,
+                    "next_poll": now + self.min_interval,
+                }
+
+            state["last_activity"] = last_activity
+            if last_activity and last_activity > state["polled_activity"]:
+                state["interval"] = self.min_interval
+                state["next_poll"] = now
+
+            if last_activity and (self.activity_mark is None or last_activity > self.activity_mark):
+                self.activity_mark = last_activity
+
+    def due_rooms(self, now: float = None) -> list:
+        """Room ids whose next poll time has come, most overdue first."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = [(state["next_poll"], room_id) for room_id, state in self._rooms.items()
+                   if state["next_poll"] <= now]
+        return [room_id for _, room_id in sorted(due)]
+
+    def record_poll(self, room_id: str, found_messages: bool, now: float = None):
+        """Schedule a room's next poll after polling it."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._rooms.get(room_id)
+            if state is None:
+                return
+            if state["last_activity"]:
+                state["polled_activity"] = max(state["polled_activity"], state["last_activity"])
+            if found_messages:
+                state["interval"] = self.min_interval
+            else:
+                state["interval"] = min(state["interval"] * 2, self.max_interval)
+            state["next_poll"] = now + state["interval"]
+
+    def retain(self, room_ids):
+        """Forget rooms that are no longer listed (the bot left them)."""
+        keep = set(room_ids)
+        with self._lock:
+            for room_id in list(self._rooms):
+                if room_id not in keep:
+                    del self._rooms[room_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rooms)
@@ -0,0 +1,55 @@
+"""
+Web Search Cache
+Answers repeated web-search questions from memory. Entries expire after
+a TTL chosen by what the question is about: fast-moving topics (weather,
+prices, outages) expire quickly, reference material (docs, how-tos)
+lives much longer.
+"""
+import re
+
+import metrics
+from cache import LRUCache
+
+# (keywords, TTL in seconds); the first category with a matching keyword wins
+SEARCH_CACHE_TTLS = [
+    (("weather", "forecast", "temperature", "stock", "price", "score",
+      "status", "outage", "down", "breaking", "now", "today"), 10 * 60),
+    (("news", "headline", "latest", "recent", "release", "announced",
+      "launched", "update", "current"), 60 * 60),
+    (("documentation", "docs", "guide", "tutorial", "how to", "what is",
+      "who is", "error", "fix", "troubleshoot"), 24 * 60 * 60),
+]
+DEFAULT_TTL = 4 * 60 * 60
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case a query and collapse punctuation and whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def ttl_for(normalized: str) -> int:
+    """TTL for a normalized query, based on its keyword category."""
+    words = f" {normalized} "
+    for keywords, ttl in SEARCH_CACHE_TTLS:
+        if any(f" {keyword} " in words for keyword in keywords):
+            return ttl
+    return DEFAULT_TTL
+
+
+class SearchCache:
+    """Bounded, TTL'd cache of web-search answers keyed by normalized query."""
+
+    def __init__(self, capacity: int = 500):
+        self._cache = LRUCache(capacity)
+
+    def get(self, model: str, query: str):
+        """Return a cached answer, or None (counting hits and misses)."""
+        answer = self._cache.get((model, normalize_query(query)))
+        metrics.incr("search_cache_hits" if answer is not None else "search_cache_misses")
+        return answer
+
+    def put(self, model: str, query: str, answer: str):
+        """Cache an answer for the query's category TTL."""
+        normalized = normalize_query(query)
+        self._cache.put((model, normalized), answer, ttl=ttl_for(normalized))
+        metrics.set_gauge("search_cache_size", len(self._cache))
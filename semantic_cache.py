@@ -0,0 +1,124 @@
+"""
+Semantic Chat Cache
+Reuses answers to earlier standalone questions that mean the same thing
+("how do I reset my VPN" / "vpn reset steps"). Prompts are embedded on
+the CPU with a hashed n-gram vectorizer and matched by cosine similarity
+with NumPy, so a near-duplicate costs microseconds instead of an LLM call.
+"""
+import re
+import threading
+import zlib
+
+import numpy as np
+
+import metrics
+
+STOPWORDS = frozenset("""
+a an the i me my we our you your it its is are was were be been do does did
+can could would will to of in on for with at by from about please hi hey
+hello thanks there this that these those and or if so any some just get got
+s t d m ll re ve
+""".split())
+
+# Words that say what kind of answer is wanted. They become one question
+# type feature each, so "when is X" and "where is X" (or "how do I reset
+# X" and "why does X reset") stay apart while "X steps" matches "how to X".
+QUESTION_TYPES = {
+    "how": "how", "steps": "how", "instructions": "how", "guide": "how", "tutorial": "how",
+    "what": "what", "explain": "what", "explained": "what", "mean": "what", "meaning": "what",
+    "why": "why", "when": "when", "where": "where", "who": "who", "which": "which",
+    "should": "should",
+}
+QUESTION_WEIGHT = 4.0
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping so "resetting" and "reset" share features."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+class HashingVectorizer:
+    """
+    Map text to a fixed-size, L2-normalized vector of hashed features:
+    the question type(s), content words (stop words dropped, lightly
+    stemmed) and their character trigrams. No vocabulary or training is
+    needed.
+    """
+
+    def __init__(self, dims: int = 4096):
+        self.dims = dims
+
+    def features(self, text: str) -> list:
+        tokens = re.findall(r"\w+", text.lower())
+        features = [f"q:{kind}" for kind in sorted({QUESTION_TYPES[t] for t in tokens if t in QUESTION_TYPES})]
+        words = [_stem(w) for w in tokens if w not in STOPWORDS and w not in QUESTION_TYPES]
+        features.extend(f"w:{w}" for w in words)
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for feature in self.features(text):
+            h = zlib.crc32(feature.encode())
+            # Question types and words count more than trigrams
+            weight = QUESTION_WEIGHT if feature.startswith("q:") else 3.0 if feature.startswith("w:") else 1.0
+            vector[h % self.dims] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Fixed-size ring of (prompt embedding, answer) pairs.
+
+    lookup() returns the answer of the most similar cached prompt with
+    the same system prompt, if its cosine similarity is at least
+    `threshold`. The oldest entry is overwritten when the ring is full.
+    """
+
+    def __init__(self, capacity: int = 1000, threshold: float = 0.82, dims: int = 4096):
+        self.capacity = max(1, capacity)
+        self.threshold = threshold
+        self.vectorizer = HashingVectorizer(dims)
+        self._vectors = np.zeros((self.capacity, dims), dtype=np.float32)
+        self._contexts = np.zeros(self.capacity, dtype=np.int64)
+        self._answers = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _context(system_prompt: str) -> int:
+        return zlib.crc32((system_prompt or "").encode())
+
+    def lookup(self, prompt: str, system_prompt: str = None):
+        """Return a cached answer for a near-duplicate prompt, or None."""
+        vector = self.vectorizer.embed(prompt)
+        context = self._context(system_prompt)
+        with self._lock:
+            if not self._size:
+                metrics.incr("semantic_cache_misses")
+                return None
+            scores = self._vectors[:self._size] @ vector
+            scores[self._contexts[:self._size] != context] = -1.0
+            best = int(np.argmax(scores))
+            answer = self._answers[best] if scores[best] >= self.threshold else None
+        metrics.incr("semantic_cache_hits" if answer is not None else "semantic_cache_misses")
+        return answer
+
+    def add(self, prompt: str, answer: str, system_prompt: str = None):
+        """Cache the answer to a standalone prompt."""
+        vector = self.vectorizer.embed(prompt)
+        with self._lock:
+            slot = self._next
+            self._vectors[slot] = vector
+            self._contexts[slot] = self._context(system_prompt)
+            self._answers[slot] = answer
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            metrics.set_gauge("semantic_cache_size", self._size)
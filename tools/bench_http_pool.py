@@ -0,0 +1,119 @@
+"""
+HTTP Connection Pool Benchmark
+Compares a fresh connection per request (the old bare requests.post in
+AIClient.search) with AIClient's pooled keep-alive client, against a
+local stub of Open WebUI's chat completions endpoint.
+
+Loopback connections are nearly free, so --connect-latency adds a delay
+to every new connection to stand in for the TCP/TLS handshake to a real
+Open WebUI host.
+
+Usage:
+    python tools/bench_http_pool.py [--requests 200] [--connect-latency 20]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "pong"},
+        "finish_reason": "stop",
+    }],
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every POST with a canned chat completion, keeping connections open."""
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    connect_latency = 0.0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle's
+        # algorithm delay the second one on kept-alive connections
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with StubHandler.lock:
+            StubHandler.connections += 1
+        time.sleep(StubHandler.connect_latency)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, send, count):
+    """Time `count` calls of `send` and report connections opened."""
+    StubHandler.connections = 0
+    send()  # warm up
+    start_connections = StubHandler.connections
+    start = time.perf_counter()
+    for _ in range(count):
+        send()
+    elapsed = time.perf_counter() - start
+    opened = StubHandler.connections - start_connections
+    print(f"{label:<28} {elapsed / count * 1000:8.3f} ms/request   {opened:5d} new connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request connection overhead.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--connect-latency", type=float, default=0.0,
+                        help="Milliseconds added to every new connection")
+    args = parser.parse_args()
+    StubHandler.connect_latency = args.connect_latency / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    os.environ["OPENWEBUI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENWEBUI_API_KEY", "bench")
+    # Every search must reach the stub, or the last row times the search cache
+    os.environ["SEARCH_CACHE_SIZE"] = "0"
+    from ai_client import AIClient
+    import httpx
+    import requests
+
+    payload = {"model": "bench", "messages": [{"role": "user", "content": "ping"}]}
+    headers = {"Authorization": "Bearer bench"}
+
+    url = f"{base_url}/chat/completions"
+
+    print(f"{args.requests} requests against {base_url}, "
+          f"{args.connect_latency:g} ms per new connection\n")
+    run("before: requests.post", lambda: requests.post(url, headers=headers, json=payload, timeout=10), args.requests)
+    run("before: httpx.post", lambda: httpx.post(url, headers=headers, json=payload, timeout=10), args.requests)
+
+    client = AIClient(model="bench")
+    run("after: pooled http_client", lambda: client.run(
+        client.aio.http_client.post(url, headers=headers, json=payload)), args.requests)
+    run("after: AIClient.search", lambda: client.search("ping"), args.requests)
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
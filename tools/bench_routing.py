@@ -0,0 +1,104 @@
+"""
+Search Routing Benchmark
+Times should_use_web_search()'s classifier (routing.classify) against
+the original substring keyword loop over a corpus of sample messages,
+and lists the messages on which the two decide differently.
+
+Usage:
+    python tools/bench_routing.py [--corpus tools/routing_corpus.txt] [--repeat 200]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routing  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_corpus.txt")
+
+# The rules as they were hard-coded in bot.py
+LEGACY_KEYWORDS = [
+    'latest', 'current', 'today', 'now', 'recent', 'new', 'update',
+    'this week', 'this month', 'this year', '2024', '2025', '2026',
+    'news', 'headline', 'breaking', 'announced', 'release', 'launched',
+    'weather', 'forecast', 'temperature', 'stock', 'price', 'score',
+    'status', 'outage', 'down', 'working',
+    'how to', 'what is', 'who is', 'when did', 'where is',
+    'documentation', 'docs', 'guide', 'tutorial', 'article',
+    'error', 'fix', 'solve', 'troubleshoot', 'issue', 'problem',
+    'not working', 'broken', 'failed', 'help me',
+]
+LEGACY_PATTERNS = [
+    r'\?\s*\?+', r'still (not|doesn\'t|won\'t|can\'t)', r'tried (everything|that|already)',
+    r'nothing (works|worked)', r'i (don\'t|cant|cannot) (understand|figure|get)',
+    r'(please|plz) help', r'what (else|now)', r'any (other|idea|suggestion)',
+]
+LEGACY_QUESTION = r'(how|what|why|when|where|can|does|is|are)\s+(the|a|my|this|it)'
+
+
+def legacy_should_search(text: str) -> bool:
+    """The original loop: each keyword, then each pattern, then the question regex."""
+    text_lower = text.lower()
+    for keyword in LEGACY_KEYWORDS:
+        if keyword in text_lower:
+            return True
+    for pattern in LEGACY_PATTERNS:
+        if re.search(pattern, text_lower):
+            return True
+    if '?' in text and len(text) > 20:
+        if re.search(LEGACY_QUESTION, text_lower):
+            return True
+    return False
+
+
+def compiled_should_search(text: str) -> bool:
+    # What should_use_web_search() runs, minus logging
+    return routing.classify(text, borderline=False).search
+
+
+def compiled_route(text: str) -> bool:
+    # Full scoring, as used for SPECULATIVE_SEARCH and the decision log
+    return routing.classify(text).search
+
+
+def bench(label, classify, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in messages:
+            classify(text)
+    per_message = (time.perf_counter() - start) / (repeat * len(messages))
+    print(f"{label:<10} {per_message * 1e6:8.2f} µs/message")
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search-routing classification.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Text file with one message per line")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        messages = [line.rstrip("\n") for line in f if line.strip()]
+
+    changed = [m for m in messages if legacy_should_search(m) != compiled_should_search(m)]
+    for text in changed:
+        print(f"{'search -> chat' if legacy_should_search(text) else 'chat -> search'}: {text!r}")
+
+    print(f"{len(messages)} messages x {args.repeat}, {len(changed)} decisions changed")
+    for label, subset in [("all", messages),
+                          ("short (<=120 chars)", [m for m in messages if len(m) <= 120]),
+                          ("long (>120 chars)", [m for m in messages if len(m) > 120])]:
+        if not subset:
+            continue
+        print(f"\n{label}: {len(subset)} messages")
+        legacy = bench("legacy", legacy_should_search, subset, args.repeat)
+        compiled = bench("compiled", compiled_should_search, subset, args.repeat)
+        route = bench("borderline", compiled_route, subset, args.repeat)
+        print(f"{'speedup':<10} {legacy / compiled:8.2f}x ({legacy / route:.2f}x with borderline)")
+
+
+if __name__ == "__main__":
+    main()
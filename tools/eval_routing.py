@@ -0,0 +1,136 @@
+"""
+Search Routing Evaluation
+Scores the auto-search router against a labeled corpus: precision and
+recall of sending a message to web search, the web-search calls it
+would make per 1,000 messages, the response time that projects to, and
+how fast it classifies.
+
+The corpus is JSON lines: {"text": "...", "search": true|false}, where
+"search" says whether the message really needs a web search.
+
+Usage:
+    python tools/eval_routing.py [--corpus tools/routing_eval.jsonl] [--rules candidate.json ...]
+                                 [--model router_model.npz ...] [--errors]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routing  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_eval.jsonl")
+
+
+def load_corpus(path: str) -> list:
+    """Read (text, needs_search) pairs from a JSON-lines file."""
+    with open(path, encoding="utf-8") as f:
+        return [(row["text"], bool(row["search"])) for row in map(json.loads, f) if row.get("text")]
+
+
+def rules_router(path: str):
+    """Classify with the rules in a search_rules.json-style file."""
+    with open(path, encoding="utf-8") as f:
+        rules = routing.SearchRules(json.load(f))
+
+    def classify(text: str):
+        route = rules.classify(text)
+        return route.search, ", ".join(route.rules)
+
+    return classify
+
+
+def model_router(path: str):
+    """Classify with a model trained by learned_router.py."""
+    from learned_router import LearnedRouter
+    router = LearnedRouter.load(path)
+
+    def classify(text: str):
+        probability = router.probability(text)
+        return probability >= router.threshold, f"p={probability:.2f}"
+
+    return classify
+
+
+def throughput(classify, texts, min_seconds: float = 0.5) -> float:
+    """Seconds per classification, averaged over at least `min_seconds`."""
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for text in texts:
+            classify(text)
+        count += len(texts)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / count
+
+
+def evaluate(name: str, classify, corpus: list, args):
+    tp = fp = fn = tn = 0
+    errors = []
+    for text, needs_search in corpus:
+        searched, reason = classify(text)
+        if searched and needs_search:
+            tp += 1
+        elif searched:
+            fp += 1
+            errors.append(("unneeded search", text, reason))
+        elif needs_search:
+            fn += 1
+            errors.append(("missed search", text, reason))
+        else:
+            tn += 1
+
+    total = len(corpus)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    per_1000 = 1000 / total
+    searches = (tp + fp) * per_1000
+    # Response time for 1,000 messages if each takes the latency of its path
+    seconds = searches * args.search_latency + (1000 - searches) * args.chat_latency
+    seconds_ideal = (tp + fn) * per_1000 * args.search_latency + (tn + fp) * per_1000 * args.chat_latency
+    per_message = throughput(lambda text: classify(text), [text for text, _ in corpus])
+
+    print(f"\n{name}")
+    print(f"  precision {precision:6.3f}   recall {recall:6.3f}   f1 {f1:6.3f}   "
+          f"accuracy {(tp + tn) / total:6.3f}")
+    print(f"  web searches per 1000 messages: {searches:7.1f}  "
+          f"(needed {(tp + fn) * per_1000:.1f}, unneeded {fp * per_1000:.1f}, missed {fn * per_1000:.1f})")
+    print(f"  response time per 1000 messages: {seconds / 60:6.1f} min  "
+          f"(perfect routing {seconds_ideal / 60:.1f} min)")
+    print(f"  throughput: {per_message * 1e6:.2f} µs/message ({1 / per_message:,.0f} messages/s)")
+    if args.errors:
+        for kind, text, reason in errors:
+            print(f"    {kind}: {text!r}" + (f"  [{reason}]" if reason else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate search routing on a labeled corpus.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON lines with text and search label")
+    parser.add_argument("--rules", action="append", default=[],
+                        help="Rules file to evaluate (repeatable; default: the live rules)")
+    parser.add_argument("--model", action="append", default=[],
+                        help="Learned router model to evaluate (repeatable)")
+    parser.add_argument("--search-latency", type=float, default=20.0,
+                        help="Assumed seconds per web-search answer")
+    parser.add_argument("--chat-latency", type=float, default=3.0,
+                        help="Assumed seconds per chat answer")
+    parser.add_argument("--errors", action="store_true", help="List misrouted messages")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    positives = sum(1 for _, needs_search in corpus if needs_search)
+    print(f"{len(corpus)} messages, {positives} need web search")
+
+    for path in args.rules or ([] if args.model else [routing.RULES_PATH]):
+        evaluate(f"rules: {path}", rules_router(path), corpus, args)
+    for path in args.model:
+        evaluate(f"model: {path}", model_router(path), corpus, args)
+
+
+if __name__ == "__main__":
+    main()
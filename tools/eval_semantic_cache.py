@@ -0,0 +1,56 @@
+"""
+Semantic Cache Evaluation
+Scores the semantic cache's similarity on labeled prompt pairs: for each
+candidate threshold, how many paraphrases would be answered from the
+cache (hits) and how many different questions would wrongly get a
+cached answer (false hits).
+
+The pairs are JSON lines: {"a": "...", "b": "...", "same": true|false},
+where "same" says whether one answer serves both prompts.
+
+Usage:
+    python tools/eval_semantic_cache.py [--pairs tools/semantic_pairs.jsonl] [--pairs-detail]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import HashingVectorizer  # noqa: E402
+
+DEFAULT_PAIRS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_pairs.jsonl")
+
+
+def load_pairs(path: str) -> list:
+    """Read (a, b, same) triples from a JSON-lines file."""
+    with open(path, encoding="utf-8") as f:
+        return [(row["a"], row["b"], bool(row["same"])) for row in map(json.loads, f) if row.get("a")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate semantic cache thresholds on labeled pairs.")
+    parser.add_argument("--pairs", default=DEFAULT_PAIRS, help="JSON lines with a, b and same label")
+    parser.add_argument("--pairs-detail", action="store_true", help="List every pair with its similarity")
+    args = parser.parse_args()
+
+    vectorizer = HashingVectorizer()
+    scored = [(float(vectorizer.embed(a) @ vectorizer.embed(b)), same, a, b)
+              for a, b, same in load_pairs(args.pairs)]
+    paraphrases = sum(1 for _, same, _, _ in scored if same)
+    print(f"{len(scored)} pairs, {paraphrases} paraphrases")
+
+    if args.pairs_detail:
+        for similarity, same, a, b in sorted(scored, reverse=True):
+            print(f"  {similarity:5.3f} {'same' if same else 'diff'}  {a!r} / {b!r}")
+
+    print(f"\n{'threshold':>9} {'hits':>6} {'false hits':>11}")
+    for threshold in [0.60, 0.65, 0.70, 0.75, 0.80, 0.82, 0.85, 0.90, 0.95]:
+        hits = sum(1 for similarity, same, _, _ in scored if same and similarity >= threshold)
+        false_hits = sum(1 for similarity, same, _, _ in scored if not same and similarity >= threshold)
+        print(f"{threshold:9.2f} {hits:3d}/{paraphrases:<3d} {false_hits:5d}/{len(scored) - paraphrases}")
+
+
+if __name__ == "__main__":
+    main()
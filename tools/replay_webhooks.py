@@ -0,0 +1,65 @@
+"""
+Webhook Replay Harness
+Replays recorded Webex webhook payloads, signed with WEBHOOK_SECRET,
+against a running bot or an in-process receiver.
+
+Usage:
+    python tools/replay_webhooks.py                      # POST samples to localhost:8080
+    python tools/replay_webhooks.py --url http://host:8080/webhook payload.json
+    python tools/replay_webhooks.py --local              # no bot needed
+    python tools/replay_webhooks.py --local --bad-signature
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import SIGNATURE_HEADER, create_app, sign_payload  # noqa: E402
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_samples")
+
+
+def load_payloads(paths):
+    """Load recorded payloads from files and/or directories."""
+    files = []
+    for path in paths or [SAMPLES_DIR]:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            files.append(path)
+
+    for path in files:
+        with open(path, "rb") as f:
+            yield path, f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Webex webhook payloads.")
+    parser.add_argument("payloads", nargs="*", help="Payload files or directories (default: tools/webhook_samples)")
+    parser.add_argument("--url", default="http://localhost:8080/webhook", help="Webhook endpoint to POST to")
+    parser.add_argument("--secret", default=os.environ.get("WEBHOOK_SECRET", "replay-secret"))
+    parser.add_argument("--local", action="store_true", help="Replay against an in-process receiver that just prints events")
+    parser.add_argument("--bad-signature", action="store_true", help="Send a wrong signature to check rejection")
+    args = parser.parse_args()
+
+    if args.local:
+        app = create_app(lambda data: print(f"  → on_message({json.dumps(data)})"), args.secret)
+        client = app.test_client()
+        post = lambda body, headers: client.post("/webhook", data=body, headers=headers).status_code
+    else:
+        import requests
+        post = lambda body, headers: requests.post(args.url, data=body, headers=headers, timeout=10).status_code
+
+    for path, body in load_payloads(args.payloads):
+        signature = sign_payload(body, args.secret)
+        if args.bad_signature:
+            signature = "0" * len(signature)
+        headers = {"Content-Type": "application/json", SIGNATURE_HEADER: signature}
+        print(f"{os.path.basename(path)}: HTTP {post(body, headers)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Webex Webhook Receiver
+Flask app that accepts Webex "messages/created" webhooks so the bot is
+notified of new messages instead of polling every room.
+"""
+import hashlib
+import hmac
+from flask import Flask, jsonify, request
+import metrics
+
+SIGNATURE_HEADER = "X-Spark-Signature"
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """Compute the HMAC-SHA1 hex digest Webex sends in X-Spark-Signature."""
+    return hmac.new(secret.encode(), body, hashlib.sha1).hexdigest()
+
+
+def verify_signature(body: bytes, signature: str, secret: str) -> bool:
+    """Check a webhook body against its X-Spark-Signature header."""
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body, secret), signature)
+
+
+def create_app(on_message, secret: str) -> Flask:
+    """
+    Build the webhook receiver.
+
+    Args:
+        on_message: Called with the webhook's "data" dict for every
+            verified messages/created event. Must return quickly (at
+            most a Webex API call or two).
+        secret: The secret the webhook was registered with
+
+    Returns:
+        A Flask app exposing POST /webhook, GET /health and GET /metrics
+    """
+    app = Flask(__name__)
+
+    @app.post("/webhook")
+    def receive_webhook():
+        body = request.get_data()
+        if not verify_signature(body, request.headers.get(SIGNATURE_HEADER, ""), secret):
+            return "invalid signature", 403
+
+        payload = request.get_json(silent=True) or {}
+        if payload.get("resource") == "messages" and payload.get("event") == "created":
+            on_message(payload.get("data") or {})
+
+        return "", 204
+
+    @app.get("/health")
+    def health():
+        return "ok"
+
+    @app.get("/metrics")
+    def show_metrics():
+        return jsonify(metrics.snapshot())
+
+    return app